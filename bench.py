@@ -0,0 +1,239 @@
+"""Benchmark suite for the simulation engine and the GUI render loop.
+
+    python main.py bench                              full suite
+    python main.py bench --suite engine --sizes 22 1000 --output bench.json
+    python main.py bench --baseline bench.json        compare, exit code 1 on regressions
+
+Suites:
+
+- ``engine``: VehicleSimulation steps/s and ns per vehicle-step for every
+  registered model, ring size and dt
+- ``ensemble``: the same for EnsembleSimulation over ensemble sizes
+- ``gui``: frame time statistics of SimulationGUI.update_plots on an
+  offscreen Qt platform, per ring size and trajectory view
+
+Every case is timed with enough steps to take about ``--budget`` seconds
+(best of ``--repeat``). Results are written as JSON; with a baseline file
+each case is compared on its main metric (ns per vehicle-step, median
+frame time) and flagged when it got slower by more than ``--tolerance``.
+The engine suites only need numpy; PyQt5 and matplotlib are imported by
+the gui suite only.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time as timer
+
+import numpy as np
+from ensemble import EnsembleSimulation
+from models import model_names
+from simulation import VehicleSimulation
+
+SUITES = ("engine", "ensemble", "gui")
+SIZES = (22, 1000, 100000, 1000000)
+REPLICAS = (1, 10, 100, 1000)
+DTS = (0.05,)
+GUI_SIZES = (22, 1000, 100000)
+GUI_VIEWS = ("Lines", "Speed raster")
+# Density of the benchmark rings: the Sugiyama experiment, 22 vehicles on 231 m
+SPACING = 10.5
+
+# Main metric of each kind of case, lower is better
+METRICS = {"engine": "ns_per_vehicle_step", "ensemble": "ns_per_vehicle_step", "gui": "median_ms"}
+
+
+def _time_steps(advance, budget, repeat):
+    """Seconds per step of advance(steps): calibrated to take ~budget, best of repeat"""
+    steps = 1
+    while True:
+        start = timer.perf_counter()
+        advance(steps)
+        elapsed = timer.perf_counter() - start
+        if elapsed >= budget / 10:
+            break
+        steps *= 4
+    steps = max(1, int(steps * budget / max(elapsed, 1e-9)))
+    best = float("inf")
+    for _ in range(repeat):
+        start = timer.perf_counter()
+        advance(steps)
+        best = min(best, (timer.perf_counter() - start) / steps)
+    return best, steps
+
+
+def _throughput(per_step, vehicles, steps):
+    return {
+        "steps": steps,
+        "steps_per_second": 1.0 / per_step,
+        "ns_per_vehicle_step": 1e9 * per_step / vehicles,
+    }
+
+
+def bench_simulation(model="SATG", n_vehicles=22, dt=0.05, budget=0.5, repeat=3, sigma=0.6, seed=0):
+    """Throughput of VehicleSimulation.step (no history kept)"""
+    sim = VehicleSimulation(n_vehicles=n_vehicles, circuit_length=SPACING * n_vehicles, dt=dt, model=model,
+                            sigma=sigma, seed=seed, history_capacity=1)
+    per_step, steps = _time_steps(lambda k: sim.run(k, record_every=0), budget, repeat)
+    return {"kind": "engine", "model": sim.model, "n_vehicles": n_vehicles, "dt": dt,
+            **_throughput(per_step, n_vehicles, steps)}
+
+
+def bench_ensemble(model="SATG", replicas=10, n_vehicles=22, dt=0.05, budget=0.5, repeat=3, sigma=0.6):
+    """Throughput of EnsembleSimulation.step (no history kept)"""
+    ens = EnsembleSimulation(seeds=range(replicas), n_vehicles=n_vehicles, circuit_length=SPACING * n_vehicles,
+                             dt=dt, model=model, sigma=sigma, record_history=False)
+
+    def advance(steps):
+        for _ in range(steps):
+            ens.step()
+
+    per_step, steps = _time_steps(advance, budget, repeat)
+    return {"kind": "ensemble", "model": model, "replicas": replicas, "n_vehicles": n_vehicles, "dt": dt,
+            **_throughput(per_step, replicas * n_vehicles, steps)}
+
+
+def bench_gui(n_vehicles=22, view="Lines", blit=True, frames=60, warmup=10, rate=20):
+    """Frame time statistics of SimulationGUI.update_plots at `rate` ticks/sec, offscreen"""
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PyQt5.QtWidgets import QApplication
+    from ui import SimulationGUI
+
+    app = QApplication.instance() or QApplication([])
+    gui = SimulationGUI()
+    gui.timer.stop()
+    gui.show()
+    gui.vehicles_input.setText(str(n_vehicles))
+    gui.length_input.setText(str(SPACING * n_vehicles))
+    gui.highlight_input.setText(str(n_vehicles - 1))
+    gui.view_combo.setCurrentText(view)
+    gui.blit_checkbox.setChecked(blit)
+    gui.speed_slider.setValue(rate)
+    gui.reset_simulation()
+    app.processEvents()
+
+    # Frames are paced like the GUI timer; frames without a new simulation state are not counted
+    times = []
+    interval = gui.timer.interval() / 1000.0
+    next_frame = timer.perf_counter()
+    while len(times) < frames + warmup:
+        next_frame += interval
+        timer.sleep(max(0.0, next_frame - timer.perf_counter()))
+        app.processEvents()
+        tick = gui._last_tick
+        start = timer.perf_counter()
+        gui.update_plots()
+        if gui._last_tick != tick:
+            times.append(timer.perf_counter() - start)
+    gui.close()
+    app.processEvents()
+
+    times = 1000 * np.array(times[warmup:])
+    return {"kind": "gui", "n_vehicles": n_vehicles, "view": view, "blit": blit, "frames": frames,
+            "mean_ms": float(times.mean()), "median_ms": float(np.median(times)),
+            "p95_ms": float(np.percentile(times, 95)), "max_ms": float(times.max())}
+
+
+def run_suite(suites=SUITES, models=None, sizes=SIZES, replicas=REPLICAS, dts=DTS, gui_sizes=GUI_SIZES,
+              gui_views=GUI_VIEWS, budget=0.5, repeat=3, progress=True):
+    """Run the selected suites; returns the list of result dicts"""
+    models = model_names() if models is None else models
+    cases = []
+    if "engine" in suites:
+        cases += [(bench_simulation, dict(model=m, n_vehicles=n, dt=dt, budget=budget, repeat=repeat))
+                  for m in models for n in sizes for dt in dts]
+    if "ensemble" in suites:
+        cases += [(bench_ensemble, dict(model=m, replicas=r, dt=dt, budget=budget, repeat=repeat))
+                  for m in models for r in replicas for dt in dts]
+    if "gui" in suites:
+        cases += [(bench_gui, dict(n_vehicles=n, view=view, blit=blit))
+                  for n in gui_sizes for view in gui_views for blit in (True, False)]
+    results = []
+    for function, kwargs in cases:
+        result = function(**kwargs)
+        results.append(result)
+        if progress:
+            print(format_result(result), flush=True)
+    return results
+
+
+def case_key(result):
+    """Identifier of a case: everything except the measurements"""
+    measured = {"steps", "steps_per_second", "ns_per_vehicle_step", "frames",
+                "mean_ms", "median_ms", "p95_ms", "max_ms"}
+    return json.dumps({k: v for k, v in result.items() if k not in measured}, sort_keys=True)
+
+
+def format_result(result):
+    kind = result["kind"]
+    if kind == "gui":
+        return (f"gui       n={result['n_vehicles']:<8} {result['view']:<13} blit={result['blit']!s:<5}  "
+                f"median {result['median_ms']:.1f} ms, p95 {result['p95_ms']:.1f} ms, max {result['max_ms']:.1f} ms")
+    size = f"n={result['n_vehicles']}" if kind == "engine" else f"R={result['replicas']}x{result['n_vehicles']}"
+    return (f"{kind:<9} {result['model']:<22} {size:<11} dt={result['dt']:<5}  "
+            f"{result['steps_per_second']:10.1f} steps/s  {result['ns_per_vehicle_step']:9.1f} ns/vehicle-step")
+
+
+def compare(results, baseline, tolerance=0.1):
+    """Match results with a baseline; list of (result, base value, new value, ratio, regressed)"""
+    base = {case_key(r): r for r in baseline}
+    rows = []
+    for result in results:
+        old = base.get(case_key(result))
+        if old is None:
+            continue
+        metric = METRICS[result["kind"]]
+        ratio = result[metric] / old[metric]
+        rows.append((result, old[metric], result[metric], ratio, ratio > 1 + tolerance))
+    return rows
+
+
+def environment():
+    return {"python": platform.python_version(), "numpy": np.__version__, "platform": platform.platform(),
+            "processor": platform.processor(), "date": timer.strftime("%Y-%m-%d %H:%M:%S")}
+
+
+def save_results(path, results):
+    with open(path, "w") as f:
+        json.dump({"environment": environment(), "results": results}, f, indent=2)
+
+
+def load_results(path):
+    with open(path) as f:
+        return json.load(f)["results"]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="main.py bench", description="Benchmark the engine and the GUI")
+    parser.add_argument("--suite", nargs="+", choices=SUITES, default=list(SUITES))
+    parser.add_argument("--models", nargs="+", default=None, help="model names (default: all registered)")
+    parser.add_argument("--sizes", nargs="+", type=int, default=list(SIZES), help="ring sizes (engine)")
+    parser.add_argument("--replicas", nargs="+", type=int, default=list(REPLICAS), help="ensemble sizes")
+    parser.add_argument("--dt", nargs="+", type=float, default=list(DTS))
+    parser.add_argument("--gui-sizes", nargs="+", type=int, default=list(GUI_SIZES))
+    parser.add_argument("--views", nargs="+", default=list(GUI_VIEWS), help="GUI trajectory views")
+    parser.add_argument("--budget", type=float, default=0.5, help="seconds per timed run")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", default=None, help="write the results as JSON")
+    parser.add_argument("--baseline", default=None, help="JSON results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="allowed slowdown before flagging (0.1 = 10%%)")
+    args = parser.parse_args(argv)
+
+    results = run_suite(args.suite, args.models, args.sizes, args.replicas, args.dt, args.gui_sizes,
+                        args.views, args.budget, args.repeat)
+    if args.output:
+        save_results(args.output, results)
+    if args.baseline:
+        rows = compare(results, load_results(args.baseline), args.tolerance)
+        print(f"\nCompared with {args.baseline} ({len(rows)} matching cases):")
+        for result, old, new, ratio, regressed in rows:
+            flag = "  REGRESSION" if regressed else ""
+            print(f"{format_result(result)}\n    {METRICS[result['kind']]}: {old:.1f} -> {new:.1f} "
+                  f"({ratio:.2f}x){flag}")
+        if any(row[4] for row in rows):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
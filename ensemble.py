@@ -0,0 +1,219 @@
+import numpy as np
+from utils import volatility
+import fastmath
+from history import History
+from models import Model, index_groups, grouped_acceleration
+from simulation import (VehicleSimulation, compute_gaps, enforce_spacing_ordered, enforce_spacing_projection,
+                        SPACING_MODES, INTEGRATORS, STREAMS, VEHICLE_LENGTH, MIN_SPEED)
+from streams import CounterNoise
+from integrators import advance
+
+class EnsembleSimulation:
+    """R independent rings advanced together as (R, n) state arrays.
+
+    Replica k uses its own ``np.random.default_rng(seeds[k])`` stream, so it
+    follows the same trajectory as ``VehicleSimulation(seed=seeds[k])`` with
+    the same model, sigma and spacing mode, also with ``streams="counter"``,
+    where replica k's draws are a function of seeds[k] alone. The adaptive
+    integrator chooses its substeps per replica, so it keeps this guarantee
+    but steps the replicas one at a time. With ``record_history=False`` no
+    per-step history is kept, which is what batch runs usually want; otherwise
+    ``history_capacity`` works as for VehicleSimulation.
+    """
+
+    def __init__(self, seeds=range(10), n_vehicles=22, circuit_length=231.0, dt=0.05, model="SATG", sigma=0.6,
+                 record_history=True, history_capacity=None, spacing="projection", integrator="euler",
+                 tolerance=1e-2, fast_math=False, streams="sequential"):
+        self.seeds = list(seeds)
+        self.R = len(self.seeds)
+        self.n = n_vehicles
+        self.L = circuit_length
+        self.dt = dt
+        # One model (name or models.Model) per replica, or one for all
+        if isinstance(model, (str, Model)):
+            model = [model] * self.R
+        if len(model) != self.R:
+            raise ValueError("model must be a name or one name per replica")
+        self.models = list(model)
+        # One sigma per replica, kept as a column so it broadcasts over vehicles
+        self.sigma = np.broadcast_to(np.asarray(sigma, dtype=float), (self.R,)).reshape(self.R, 1).copy()
+        self.rngs = [np.random.default_rng(seed) for seed in self.seeds]
+        if streams not in STREAMS:
+            raise ValueError(f"streams must be one of {STREAMS}")
+        self.streams = streams
+        if spacing not in SPACING_MODES:
+            raise ValueError(f"spacing must be one of {SPACING_MODES}")
+        self.spacing = spacing
+        # Time integration scheme (see integrators.py)
+        if integrator not in INTEGRATORS:
+            raise ValueError(f"integrator must be one of {INTEGRATORS}")
+        self.integrator = integrator
+        self.tolerance = tolerance
+        # Tabulated and simplified model functions instead of the exact ones (see fastmath.py)
+        self.fast_math = fast_math
+        self.record_history = record_history
+        self.history_capacity = history_capacity
+        # Online statistics updated after every step, one value per replica (see observables.py)
+        self.observables = []
+        self.reset()
+
+    def reset(self):
+        # Evenly spaced initial positions, all same speed, in every replica
+        self.x = np.tile(np.linspace(0, self.L, self.n, endpoint=False), (self.R, 1))
+        self.speed = np.full((self.R, self.n), 5.0)
+        self.acc = np.zeros((self.R, self.n))
+        self.gap = np.zeros((self.R, self.n))
+        self.time = 0.0
+        self.tick = 0
+        self.substeps = 1
+        # The adaptive scheme refines each replica on its own, exactly as a standalone run of its seed
+        self._replicas = None
+        if self.integrator == "adaptive":
+            self._replicas = [self._replica(k) for k in range(self.R)]
+        # Counter-based noise of all replicas, generated together (see streams.py)
+        self._counter = CounterNoise(self.seeds, self.n) if self.streams == "counter" else None
+        self._draw_tick = -1
+        self._draws = 0
+        # Replicas sharing a model are evaluated together
+        self._set_groups()
+        # History rows hold one entry per replica
+        self.history = History((self.R, self.n), capacity=self.history_capacity) if self.record_history else None
+        self._record()
+
+    def _set_groups(self):
+        self._groups = index_groups(self.models)
+        self._volatility = volatility
+        if self.fast_math:
+            self._groups = [(fastmath.fast_model(model), rows) for model, rows in self._groups]
+            self._volatility = fastmath.volatility
+
+    def select(self, replicas):
+        """Keep only the given replicas (indices or a boolean mask), e.g. to drop finished runs.
+
+        The remaining replicas continue exactly as before. Observables are
+        narrowed down to the same replicas; a kept history cannot be.
+        """
+        if self.record_history:
+            raise ValueError("select() needs record_history=False")
+        index = np.arange(self.R)[replicas]
+        self.seeds = [self.seeds[k] for k in index]
+        self.rngs = [self.rngs[k] for k in index]
+        if self._counter is not None:
+            self._counter.select(index)
+        if self._replicas is not None:
+            self._replicas = [self._replicas[k] for k in index]
+            self.substeps = np.asarray(self.substeps)[index] if np.ndim(self.substeps) else self.substeps
+        self.models = [self.models[k] for k in index]
+        self.sigma = self.sigma[index]
+        self.R = len(index)
+        self.x = self.x[index]
+        self.speed = self.speed[index]
+        self.acc = self.acc[index]
+        self.gap = self.gap[index]
+        self._set_groups()
+        for observable in self.observables:
+            observable.select(index)
+        return index
+
+    def _replica(self, k):
+        # Standalone run of replica k sharing its generator; holds its substep level and draw lanes
+        replica = VehicleSimulation(n_vehicles=self.n, circuit_length=self.L, dt=self.dt, model=self.models[k],
+                                    sigma=float(self.sigma[k, 0]), seed=self.seeds[k], history_capacity=1,
+                                    spacing=self.spacing, integrator=self.integrator, tolerance=self.tolerance,
+                                    fast_math=self.fast_math, streams=self.streams)
+        replica.rng = self.rngs[k]
+        return replica
+
+    def _advance_replicas(self):
+        rows = []
+        for k, replica in enumerate(self._replicas):
+            replica.x, replica.speed = self.x[k], self.speed[k]
+            replica.time, replica.tick = self.time, self.tick
+            rows.append(advance(replica))
+        # Substeps of the last step, per replica
+        self.substeps = np.array([replica.substeps for replica in self._replicas])
+        return tuple(np.array(arrays) for arrays in zip(*rows))
+
+    def apply_perturbation(self, replicas=None, vehicle=None, factor=0.2):
+        """Apply a braking perturbation (default: the blue, i.e. last, vehicle) in the given replicas"""
+        rows = slice(None) if replicas is None else replicas
+        if vehicle is None:
+            vehicle = self.n - 1
+        self.speed[rows, vehicle] *= factor
+
+    def _normal(self):
+        """Standard normal draws from each replica's own stream"""
+        if self._counter is not None:
+            if self._draw_tick != self.tick:
+                self._draw_tick = self.tick
+                self._draws = 0
+            lane = self._draws
+            self._draws += 1
+            return self._counter.draw(self.tick, lane)
+        dW = np.empty_like(self.speed)
+        for k, rng in enumerate(self.rngs):
+            dW[k] = rng.normal(0, 1, self.n)
+        return dW
+
+    def step(self):
+        if self.integrator != "euler":
+            if self._replicas is not None:
+                self.x, self.speed, self.acc, self.gap = self._advance_replicas()
+            else:
+                self.x, self.speed, self.acc, self.gap = advance(self)
+            self.time += self.dt
+            self.tick += 1
+            self._record()
+            for observable in self.observables:
+                observable.update(self)
+            return
+        L = self.L
+        dt = self.dt
+        x = self.x
+        speed = self.speed
+
+        # Gaps and relative speeds for every replica at once
+        gap = compute_gaps(x, L)
+        rel_speed = np.roll(speed, -1, axis=1) - speed
+
+        # One array pass per distinct model
+        acc = grouped_acceleration(self._groups, gap, speed, rel_speed)
+        noise_volatility = self._volatility(speed, self.sigma)
+
+        # Wiener increments, one independent stream per replica
+        dW = self._normal()
+        valid = np.abs(acc) < 1e5
+
+        # Euler-Maruyama update, identical to VehicleSimulation.step
+        new_speed = np.where(valid, speed + dt * acc + np.sqrt(dt) * noise_volatility * dW, speed)
+        new_speed = np.maximum(new_speed, MIN_SPEED)
+        new_x = x + new_speed * dt
+
+        # Enforce minimum spacing, only in replicas where some pair is too close
+        if self.spacing == "ordered":
+            dist = np.roll(new_x, -1, axis=1) - new_x
+            dist[dist < 0] += L
+            for k in np.flatnonzero((dist < VEHICLE_LENGTH).any(axis=1)):
+                enforce_spacing_ordered(new_x[k], L)
+        else:
+            enforce_spacing_projection(new_x, L)
+
+        # Apply periodic boundary conditions
+        new_x = new_x % L
+
+        # Update state
+        self.x = new_x
+        self.speed = new_speed
+        self.acc = acc
+        self.gap = gap
+        self.time += dt
+        self.tick += 1
+        self._record()
+        for observable in self.observables:
+            observable.update(self)
+
+    def _record(self):
+        if not self.record_history:
+            return
+        self.history.append(self.x, self.speed, self.gap,
+                            np.mean(self.speed, axis=1), np.std(self.gap, axis=1), self.time)
@@ -0,0 +1,207 @@
+"""Fast-math versions of the model functions, for long runs and large sweeps.
+
+``VehicleSimulation(fast_math=True)`` (and EnsembleSimulation, sweeps and
+``run --fast-math``) swaps the exact functions for these:
+
+- ``logsumexp`` (SATG's smooth time gap bounds): the hard max/min plus
+  ``eps * log1p(exp(-|a - b| / |eps|))`` read from a lookup table, only
+  where ``|a - b| < SOFT_BAND * |eps|``; elsewhere the correction is below
+  1e-16 and is dropped
+- ``volatility``: exactly sigma or 0 where the sigmoid has saturated
+  (``|v - 0.1| >= SOFT_BAND / 1000``), a lookup table in between
+- ``optimal_velocity``: numpy's tanh instead of two exponentials
+- IDM's ``(v / v0)**delta`` by repeated multiplication for integer delta
+
+The tables use linear interpolation on a uniform grid and are built once,
+on first use. Rings shorter than MIN_SIZE vehicles keep the exact
+logsumexp and volatility, where the masking would cost more than it saves. Linear interpolation is off by at most h**2 / 8 * max|f''|,
+which gives the bounds in MAX_ERRORS (absolute, in the units of each
+function). ``error_report()`` measures the actual errors against the exact
+path, and ``python fastmath.py`` prints them with exact vs fast timings.
+Tabulating V(s) itself was tried and is slower than numpy's vectorised
+tanh, so V keeps a closed form.
+"""
+import argparse
+import functools
+import time as timer
+
+import numpy as np
+import models
+import utils
+
+# Beyond this many units of |eps| (or 1/1000 m/s for the volatility) the smooth
+# correction is below exp(-37) ~ 1e-16 and dropped
+SOFT_BAND = 37.0
+# Table points per unit of the scaled argument
+TABLE_RESOLUTION = 1000
+# Below this many elements the masking costs more than it saves: use the exact functions
+MIN_SIZE = 2048
+# Upper bounds of the absolute error of each fast function
+MAX_ERRORS = {
+    # log1p(exp(-d)): |f''| <= 1/4, plus the dropped tail exp(-37); times |eps|
+    "logsumexp": 0.25 / 8 / TABLE_RESOLUTION ** 2 + np.exp(-SOFT_BAND),
+    # sigmoid: |f''| <= 0.0963, times sigma
+    "volatility": 0.0963 / 8 / TABLE_RESOLUTION ** 2 + np.exp(-SOFT_BAND),
+    "optimal_velocity": 1e-14,
+}
+
+
+class LookupTable:
+    """f sampled on a uniform grid over [lo, hi] and interpolated linearly (clamped outside)"""
+
+    def __init__(self, f, lo, hi, points):
+        self.lo = lo
+        self.hi = hi
+        self.scale = (points - 1) / (hi - lo)
+        self.values = f(np.linspace(lo, hi, points))
+        # One extra interval so that x == hi needs no special case
+        self.slopes = np.append(np.diff(self.values), 0.0)
+
+    def __call__(self, x):
+        u = (np.clip(x, self.lo, self.hi) - self.lo) * self.scale
+        i = u.astype(np.intp)
+        return self.values[i] + (u - i) * self.slopes[i]
+
+
+@functools.lru_cache(maxsize=None)
+def softplus_table():
+    """log1p(exp(-d)) for d in [0, SOFT_BAND]"""
+    return LookupTable(lambda d: np.log1p(np.exp(-d)), 0.0, SOFT_BAND, int(SOFT_BAND * TABLE_RESOLUTION) + 1)
+
+
+@functools.lru_cache(maxsize=None)
+def sigmoid_table():
+    """1 / (1 + exp(-u)) for u in [-SOFT_BAND, SOFT_BAND]"""
+    return LookupTable(lambda u: 1 / (1 + np.exp(-u)), -SOFT_BAND, SOFT_BAND,
+                       int(2 * SOFT_BAND * TABLE_RESOLUTION) + 1)
+
+
+def logsumexp(a, b, eps):
+    """Same as utils.logsumexp up to MAX_ERRORS["logsumexp"] * |eps|"""
+    a, b = np.broadcast_arrays(np.asarray(a, dtype=float), np.asarray(b, dtype=float))
+    if a.size < MIN_SIZE:
+        return utils.logsumexp(a, b, eps)
+    result = np.maximum(a, b) if eps > 0 else np.minimum(a, b)
+    d = np.abs(a - b)
+    d /= abs(eps)
+    soft = d < SOFT_BAND
+    if soft.any():
+        # The exact path also falls back to the hard bound where a/eps or b/eps is out of range
+        inside = (np.abs(a[soft]) < 700 * abs(eps)) & (np.abs(b[soft]) < 700 * abs(eps))
+        result[soft] += np.where(inside, eps * softplus_table()(d[soft]), 0.0)
+    return result[()]
+
+
+def volatility(v, sigma, out=None):
+    """Same as utils.volatility up to MAX_ERRORS["volatility"] * sigma"""
+    if np.size(v) < MIN_SIZE:
+        return utils.volatility(v, sigma, out=out)
+    width = SOFT_BAND / 1000
+    switch = (v >= 0.1 + width).astype(float)
+    soft = np.abs(v - 0.1) < width
+    if soft.any():
+        switch[soft] = sigmoid_table()(1000 * (v[soft] - 0.1))
+    return np.multiply(sigma, switch, out=out)
+
+
+def optimal_velocity(s):
+    return 13.7 * np.tanh(s / 20 - 0.5) + 6.3
+
+
+def _power(x, k):
+    # x**k for a positive integer k by repeated squaring
+    result = None
+    while k:
+        if k & 1:
+            result = x if result is None else result * x
+        k >>= 1
+        if k:
+            x = x * x
+    return result
+
+
+def ovm(g, v, dv, tau):
+    return (optimal_velocity(g) - v) / tau
+
+
+def fvdm(g, v, dv, tau, kappa):
+    return (optimal_velocity(g) - v) / tau + dv / kappa
+
+
+def idm(g, v, dv, A, a=2, s0=2, T=1, v0=20, delta=4):
+    if delta != int(delta) or delta < 1:
+        return models.idm(g, v, dv, A, a, s0, T, v0, delta)
+    f = s0 + T * v - v * dv / A
+    ratio = f / g
+    return a * (1 - ratio * ratio - _power(v / v0, int(delta)))
+
+
+def atg(g, v, dv, gamma=0.2, T_min=0.1, T_max=4, eps=0.01):
+    bounded_time_gap = logsumexp(logsumexp(g / logsumexp(v, 1e-10, eps), T_max, -eps), T_min, eps)
+    return (gamma * (g - v) + dv) / bounded_time_gap
+
+
+# Fast replacement of each exact acceleration function; others (Tomer) have nothing to replace
+FAST_ACCELERATIONS = {models.ovm: ovm, models.fvdm: fvdm, models.idm: idm, models.atg: atg}
+
+
+@functools.lru_cache(maxsize=None)
+def fast_model(model):
+    """Fast-math copy of a models.Model (cached per model)"""
+    accel = FAST_ACCELERATIONS.get(model.accel)
+    if accel is None:
+        return model
+    return models.Model(model.name, accel, **model.params)
+
+
+def error_report(samples=200000, seed=0):
+    """Largest absolute errors of the fast functions against the exact ones, on dense samples"""
+    rng = np.random.default_rng(seed)
+    # samples >= MIN_SIZE, so that the tables are exercised
+    d = np.concatenate([np.linspace(0, 2 * SOFT_BAND, samples), rng.uniform(0, SOFT_BAND, samples)])
+    v = np.concatenate([np.linspace(0, 0.3, samples), rng.uniform(0, 30, samples)])
+    s = np.concatenate([np.linspace(0, 500, samples), rng.uniform(0.1, 100, samples)])
+    eps = 0.01
+    report = {
+        "logsumexp": float(np.max(np.abs(logsumexp(d * eps, 0.0, eps) - utils.logsumexp(d * eps, 0.0, eps))) / eps),
+        "volatility": float(np.max(np.abs(volatility(v, 1.0) - utils.volatility(v, 1.0)))),
+        "optimal_velocity": float(np.max(np.abs(optimal_velocity(s) - models.optimal_velocity(s)))),
+    }
+    # Accelerations of the registered models on random states
+    g = rng.uniform(0.1, 60, samples)
+    speed = rng.uniform(0.1, 20, samples)
+    dv = rng.normal(0, 2, samples)
+    for name in models.model_names():
+        model = models.get_model(name)
+        exact = model.acceleration(g, speed, dv)
+        fast = fast_model(model).acceleration(g, speed, dv)
+        report[f"acceleration {name}"] = float(np.max(np.abs(fast - exact)))
+    return report
+
+
+def main(argv=None):
+    from simulation import VehicleSimulation
+    parser = argparse.ArgumentParser(description="Errors and speed of the fast-math functions")
+    parser.add_argument("-n", "--vehicles", type=int, default=100000)
+    parser.add_argument("--steps", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    print(f"{'function':<36}{'max error':>12}{'bound':>12}")
+    for name, error in error_report().items():
+        bound = MAX_ERRORS.get(name)
+        print(f"{name:<36}{error:>12.2e}{'' if bound is None else format(bound, '12.2e')}")
+    print(f"\n{'model':<24}{'exact ns':>10}{'fast ns':>10}  per vehicle-step, n={args.vehicles}")
+    for name in models.model_names():
+        times = []
+        for fast in (False, True):
+            sim = VehicleSimulation(n_vehicles=args.vehicles, circuit_length=10.5 * args.vehicles, model=name,
+                                    history_capacity=1, fast_math=fast)
+            sim.run(2, record_every=0)
+            start = timer.perf_counter()
+            sim.run(args.steps, record_every=0)
+            times.append(1e9 * (timer.perf_counter() - start) / args.steps / args.vehicles)
+        print(f"{name:<24}{times[0]:>10.1f}{times[1]:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
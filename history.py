@@ -0,0 +1,155 @@
+import numpy as np
+
+# Fields recorded per step: the vehicle fields have one value per vehicle,
+# the summary fields one value per ring and time one value per step
+VEHICLE_FIELDS = ("x", "speed", "gap")
+RING_FIELDS = ("mean_speed", "gap_sd")
+FIELDS = VEHICLE_FIELDS + RING_FIELDS + ("time",)
+
+
+class History:
+    """Simulation record backed by preallocated contiguous arrays.
+
+    ``row_shape`` is the shape of one ``x`` row, ``(n,)`` for a single ring
+    or ``(R, n)`` for an ensemble. With ``capacity=None`` the store grows by
+    doubling and keeps every step. With an integer capacity it is a bounded
+    ring that keeps the last ``capacity`` steps; every row is written twice
+    (at slot i and i + capacity) so that any window of recent steps is a
+    contiguous, zero-copy view.
+
+    ``history["x"]`` returns a view of the stored steps in chronological
+    order, so code written against the old dict of lists keeps working.
+    """
+
+    def __init__(self, row_shape, capacity=None, initial_capacity=1024):
+        self.row_shape = tuple(row_shape)
+        self.bounded = capacity is not None
+        if self.bounded and capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.capacity = capacity if self.bounded else initial_capacity
+        self._buffers = {}
+        self._allocate(self.capacity)
+        self._count = 0
+
+    def _field_shape(self, name):
+        if name in VEHICLE_FIELDS:
+            return self.row_shape
+        if name in RING_FIELDS:
+            return self.row_shape[:-1]
+        return ()
+
+    def _allocate(self, capacity):
+        rows = 2 * capacity if self.bounded else capacity
+        old = self._buffers
+        self._buffers = {name: np.empty((rows,) + self._field_shape(name)) for name in FIELDS}
+        if old and not self.bounded:
+            # Growing: carry over what has been recorded so far
+            for name in FIELDS:
+                self._buffers[name][:self._count] = old[name][:self._count]
+        self.capacity = capacity
+
+    def append(self, x, speed, gap, mean_speed, gap_sd, time):
+        """Record one step; O(1) and allocation-free except when growing"""
+        if self.bounded:
+            slot = self._count % self.capacity
+            slots = (slot, slot + self.capacity)
+        else:
+            if self._count == self.capacity:
+                self._allocate(2 * self.capacity)
+            slots = (self._count,)
+        values = (x, speed, gap, mean_speed, gap_sd, time)
+        for name, value in zip(FIELDS, values):
+            buf = self._buffers[name]
+            for slot in slots:
+                buf[slot] = value
+        self._count += 1
+
+    def clear(self):
+        self._count = 0
+
+    def __len__(self):
+        return min(self._count, self.capacity) if self.bounded else self._count
+
+    @property
+    def total_steps(self):
+        """Number of steps appended since the last clear, including overwritten ones"""
+        return self._count
+
+    @property
+    def nbytes(self):
+        return sum(buf.nbytes for buf in self._buffers.values())
+
+    def last(self, name, steps=None):
+        """View of the most recent `steps` entries of a field (all stored steps by default)"""
+        size = len(self)
+        steps = size if steps is None else max(0, min(steps, size))
+        buf = self._buffers[name]
+        if not self.bounded:
+            return buf[self._count - steps:self._count]
+        end = (self._count - 1) % self.capacity + self.capacity + 1
+        return buf[end - steps:end]
+
+    def __getitem__(self, name):
+        if name not in self._buffers:
+            raise KeyError(name)
+        return self.last(name)
+
+    def keys(self):
+        return FIELDS
+
+    def __contains__(self, name):
+        return name in self._buffers
+
+
+class SlidingWindow:
+    """The last ``capacity`` values of a few scalar series, e.g. time, mean_speed, gap_sd.
+
+    Uses the same mirrored layout as a bounded History: appending is O(1)
+    and ``window["time"]`` is always a contiguous view in chronological order.
+    """
+
+    def __init__(self, capacity, names=("time",) + RING_FIELDS):
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.capacity = capacity
+        self.names = tuple(names)
+        self._rows = {name: i for i, name in enumerate(self.names)}
+        self._buffer = np.empty((len(self.names), 2 * capacity))
+        self._count = 0
+
+    def append(self, *values):
+        slot = self._count % self.capacity
+        self._buffer[:, slot] = values
+        self._buffer[:, slot + self.capacity] = values
+        self._count += 1
+
+    def extend(self, other):
+        """Append everything stored in another window with the same names"""
+        values = other.values()[:, -self.capacity:]
+        steps = values.shape[1]
+        slots = (self._count + np.arange(steps)) % self.capacity
+        self._buffer[:, slots] = values
+        self._buffer[:, slots + self.capacity] = values
+        self._count += steps
+
+    def clear(self):
+        self._count = 0
+
+    def __len__(self):
+        return min(self._count, self.capacity)
+
+    @property
+    def total_steps(self):
+        """Number of values appended since the last clear, including overwritten ones"""
+        return self._count
+
+    def values(self):
+        """View of all stored values, one row per series"""
+        end = (self._count - 1) % self.capacity + self.capacity + 1
+        return self._buffer[:, end - len(self):end]
+
+    def __getitem__(self, name):
+        return self.values()[self._rows[name]]
+
+    def keys(self):
+        return self.names
@@ -0,0 +1,304 @@
+"""Time integrators for the vehicle SDE, and a strong convergence report.
+
+Every vehicle follows
+
+    dx = v dt,    dv = a(gap, v, dv) dt + s(v) dW
+
+with the model acceleration a and the noise volatility s of utils.py.
+Each scheme advances the state by one step of size h, then applies the
+same limits as the Euler-Maruyama step of VehicleSimulation: the speed is
+kept where the acceleration blew up, floored at MIN_SPEED, and vehicles
+are pushed apart to the minimum spacing.
+
+- ``euler``: Euler-Maruyama, built into VehicleSimulation (the default)
+- ``heun``: stochastic Heun, a predictor-corrector step with the
+  trapezoidal rule for the drift (and the positions) and the Ito noise
+  term of the start of the step
+- ``milstein``: Euler-Maruyama plus the Milstein correction
+  ``s(v) s'(v) (dW^2 - h) / 2`` for the speed dependent volatility
+- ``adaptive``: Heun steps on a dyadic subdivision of dt. Each substep is
+  compared with two half steps; when they differ by more than the
+  tolerance (m/s in speed, m in position) the substep is halved, with the
+  midpoint of its Brownian increment drawn from the Brownian bridge so the
+  refined noise is the same path.
+
+Select one with ``VehicleSimulation(integrator=...)`` or
+``EnsembleSimulation(integrator=...)``. ``convergence_report`` measures
+the strong error of each scheme and step size against a fine-dt reference
+driven by the same Brownian paths (``python main.py converge``).
+"""
+import argparse
+import time as timer
+
+import numpy as np
+from models import grouped_acceleration
+from simulation import (VehicleSimulation, compute_gaps, ring_difference, enforce_spacing_ordered,
+                        enforce_spacing_projection, MIN_SPEED, VEHICLE_LENGTH)
+from utils import volatility_derivative
+
+# Finest substep of the adaptive scheme: dt / 2**MAX_LEVEL
+MAX_LEVEL = 10
+
+
+def drift(sim, x, speed):
+    """Model acceleration and gaps for positions x and speeds (along the last axis)"""
+    gap = compute_gaps(x, sim.L)
+    return grouped_acceleration(sim._groups, gap, speed, ring_difference(speed)), gap
+
+
+def limit_speed(speed, new_speed, acc):
+    # Keep the old speed where the acceleration blew up, and never stop completely
+    return np.maximum(np.where(np.abs(acc) < 1e5, new_speed, speed), MIN_SPEED)
+
+
+def place(sim, new_x):
+    """Enforce the minimum spacing and the periodic boundary, in place"""
+    L = sim.L
+    if sim.spacing == "ordered":
+        rows = new_x.reshape(-1, new_x.shape[-1])
+        dist = np.roll(rows, -1, axis=1) - rows
+        dist[dist < 0] += L
+        for k in np.flatnonzero((dist < VEHICLE_LENGTH).any(axis=1)):
+            enforce_spacing_ordered(rows[k], L)
+    else:
+        enforce_spacing_projection(new_x, L)
+    return np.remainder(new_x, L, out=new_x)
+
+
+def euler_step(sim, x, speed, h, dW):
+    """One step; returns new positions, new speeds and the acceleration and gaps at the start"""
+    acc, gap = drift(sim, x, speed)
+    new_speed = limit_speed(speed, speed + h * acc + sim._volatility(speed, sim.sigma) * dW, acc)
+    return place(sim, x + h * new_speed), new_speed, acc, gap
+
+
+def heun_step(sim, x, speed, h, dW):
+    acc, gap = drift(sim, x, speed)
+    noise = sim._volatility(speed, sim.sigma) * dW
+    predicted = limit_speed(speed, speed + h * acc + noise, acc)
+    predicted_acc, _ = drift(sim, np.remainder(x + h * predicted, sim.L), predicted)
+    new_speed = speed + 0.5 * h * (acc + predicted_acc) + noise
+    new_speed = limit_speed(speed, new_speed, np.maximum(np.abs(acc), np.abs(predicted_acc)))
+    return place(sim, x + 0.5 * h * (speed + new_speed)), new_speed, acc, gap
+
+
+def milstein_step(sim, x, speed, h, dW):
+    acc, gap = drift(sim, x, speed)
+    s = sim._volatility(speed, sim.sigma)
+    correction = 0.5 * s * volatility_derivative(speed, sim.sigma) * (dW * dW - h)
+    new_speed = limit_speed(speed, speed + h * acc + s * dW + correction, acc)
+    return place(sim, x + h * new_speed), new_speed, acc, gap
+
+
+STEPPERS = {"euler": euler_step, "heun": heun_step, "milstein": milstein_step}
+
+
+class RandomNoise:
+    """Brownian increments from the simulation's own generators"""
+
+    def __init__(self, sim):
+        self.sim = sim
+
+    def increment(self, t, h):
+        return np.sqrt(h) * self.sim._normal()
+
+    def max_level(self, dt):
+        return MAX_LEVEL
+
+    def split(self, t, h, dW):
+        # Brownian bridge: W(t + h/2) - W(t) given W(t + h) - W(t) = dW
+        return 0.5 * dW + 0.5 * np.sqrt(h) * self.sim._normal()
+
+
+class PathNoise:
+    """Increments of one fixed Brownian path per vehicle, sampled every fine_dt (convergence tests)"""
+
+    def __init__(self, increments, fine_dt):
+        shape = (1,) + increments.shape[1:]
+        self.W = np.concatenate([np.zeros(shape), np.cumsum(increments, axis=0)])
+        self.fine_dt = fine_dt
+        self.offset = 0.0
+
+    def _index(self, t):
+        return int(round((t - self.offset) / self.fine_dt))
+
+    def increment(self, t, h):
+        return self.W[self._index(t + h)] - self.W[self._index(t)]
+
+    def split(self, t, h, dW):
+        return self.increment(t, 0.5 * h)
+
+    def max_level(self, dt):
+        # Substeps must still be split on the sampled grid
+        return min(MAX_LEVEL, int(np.log2(dt / self.fine_dt + 1e-9)) - 1)
+
+
+def ring_distance(a, b, L):
+    return np.abs(np.remainder(a - b + 0.5 * L, L) - 0.5 * L)
+
+
+def adaptive_step(sim, x, speed, dt, noise, level=0, tolerance=1e-2, stepper=heun_step, max_level=MAX_LEVEL):
+    """Advance by dt in substeps of dt / 2**k, refined where a substep misses the tolerance.
+
+    Substeps are not refined beyond dt / 2**max_level. Returns new positions and speeds, the acceleration and gaps at the
+    start, the level to begin the next step with (the finest level used if
+    a substep was refined, otherwise one coarser) and the number of
+    accepted substeps.
+    """
+    t = sim.time
+    h = dt / 2 ** level
+    segments = [(t + k * h, h, noise.increment(t + k * h, h), level) for k in reversed(range(2 ** level))]
+    start = None
+    finest = level
+    refined = False
+    accepted = 0
+    while segments:
+        t, h, dW, k = segments.pop()
+        full_x, full_speed, acc, gap = stepper(sim, x, speed, h, dW)
+        if start is None:
+            start = (acc, gap)
+        dW1 = noise.split(t, h, dW)
+        dW2 = dW - dW1
+        mid_x, mid_speed, _, _ = stepper(sim, x, speed, 0.5 * h, dW1)
+        half_x, half_speed, _, _ = stepper(sim, mid_x, mid_speed, 0.5 * h, dW2)
+        error = max(np.max(np.abs(half_speed - full_speed)), np.max(ring_distance(half_x, full_x, sim.L)))
+        if error <= tolerance or k >= max_level:
+            x, speed = half_x, half_speed
+            finest = max(finest, k)
+            accepted += 1
+        else:
+            segments += [(t + 0.5 * h, 0.5 * h, dW2, k + 1), (t, 0.5 * h, dW1, k + 1)]
+            refined = True
+    next_level = finest if refined else max(0, level - 1)
+    return x, speed, start[0], start[1], next_level, accepted
+
+
+def advance(sim, noise=None):
+    """One step of sim.dt with sim.integrator; returns new x, new speed, acceleration, gaps"""
+    noise = RandomNoise(sim) if noise is None else noise
+    if sim.integrator == "adaptive":
+        max_level = noise.max_level(sim.dt)
+        x, speed, acc, gap, sim._level, sim.substeps = adaptive_step(sim, sim.x, sim.speed, sim.dt, noise,
+                                                                     min(sim._level, max_level), sim.tolerance,
+                                                                     max_level=max_level)
+        return x, speed, acc, gap
+    return STEPPERS[sim.integrator](sim, sim.x, sim.speed, sim.dt, noise.increment(sim.time, sim.dt))
+
+
+def convergence_report(model="SATG", sigma=0.3, n_vehicles=22, circuit_length=231.0, horizon=20.0,
+                       dts=(0.05, 0.1, 0.2, 0.4), integrators=("euler", "heun", "milstein", "adaptive"),
+                       reference_dt=0.05 / 64, paths=8, warmup=100.0, tolerance=1e-2, seed=0):
+    """Strong errors of each integrator and step size after `horizon` seconds.
+
+    Every path starts from the state of a `warmup` second Euler run (one
+    seed per path). The reference is Euler-Maruyama at reference_dt, and
+    all runs of a path are driven by the same Brownian path, so the errors
+    measure the scheme, not the noise. horizon must be a multiple of every
+    dt and every dt a multiple of reference_dt. Returns one dict per (integrator,
+    dt): RMS speed and position errors over vehicles and paths, wall
+    seconds per simulated second and, for the adaptive scheme, the mean
+    number of substeps per step.
+    """
+    dts = sorted(dts)
+    for dt in dts:
+        if abs(dt / reference_dt - round(dt / reference_dt)) > 1e-9:
+            raise ValueError("every dt must be a multiple of reference_dt")
+        if abs(horizon / dt - round(horizon / dt)) > 1e-9:
+            raise ValueError("horizon must be a multiple of every dt")
+    fine_steps = int(round(horizon / reference_dt))
+    errors = {(name, dt): [] for name in integrators for dt in dts}
+    costs = {key: 0.0 for key in errors}
+    substeps = {key: 0 for key in errors}
+    for path in range(paths):
+        start = VehicleSimulation(n_vehicles=n_vehicles, circuit_length=circuit_length, model=model, sigma=sigma,
+                                  seed=seed + path, history_capacity=1)
+        start.run(int(round(warmup / start.dt)), record_every=0)
+        state = start.get_state()
+        rng = np.random.default_rng([seed, path])
+        noise = PathNoise(np.sqrt(reference_dt) * rng.standard_normal((fine_steps, n_vehicles)), reference_dt)
+
+        def simulate(integrator, dt):
+            sim = VehicleSimulation.from_state(state)
+            sim.dt = dt
+            sim.integrator = integrator
+            sim.tolerance = tolerance
+            noise.offset = sim.time
+            begin = timer.perf_counter()
+            counted = 0
+            for _ in range(int(round(horizon / dt))):
+                sim.x, sim.speed, sim.acc, sim.gap = advance(sim, noise)
+                sim.time += dt
+                sim.tick += 1
+                counted += sim.substeps
+            return sim, timer.perf_counter() - begin, counted
+
+        reference, _, _ = simulate("euler", reference_dt)
+        for name in integrators:
+            for dt in dts:
+                sim, seconds, counted = simulate(name, dt)
+                errors[name, dt].append((np.mean((sim.speed - reference.speed) ** 2),
+                                         np.mean(ring_distance(sim.x, reference.x, sim.L) ** 2)))
+                costs[name, dt] += seconds / horizon / paths
+                substeps[name, dt] += counted / (horizon / dt) / paths
+    rows = []
+    for (name, dt), values in errors.items():
+        speed_error, position_error = np.sqrt(np.mean(values, axis=0))
+        row = {"integrator": name, "dt": dt, "speed_rmse": float(speed_error),
+               "position_rmse": float(position_error), "seconds_per_second": costs[name, dt]}
+        if name == "adaptive":
+            row["substeps"] = substeps[name, dt]
+        rows.append(row)
+    return rows
+
+
+def largest_dt(rows, reference="euler"):
+    """Per integrator, the largest dt whose speed error is at most that of `reference` at its smallest dt"""
+    base = min((r for r in rows if r["integrator"] == reference), key=lambda r: r["dt"])
+    best = {}
+    for row in rows:
+        if row["speed_rmse"] <= base["speed_rmse"] and row["dt"] > best.get(row["integrator"], {"dt": 0})["dt"]:
+            best[row["integrator"]] = row
+    return base, best
+
+
+def format_report(rows):
+    lines = [f"{'integrator':<10}{'dt':>8}{'speed rmse':>13}{'pos rmse':>11}{'cost s/s':>10}{'substeps':>10}"]
+    for r in rows:
+        substeps = f"{r['substeps']:10.1f}" if "substeps" in r else ""
+        lines.append(f"{r['integrator']:<10}{r['dt']:>8.4g}{r['speed_rmse']:>13.3e}{r['position_rmse']:>11.3e}"
+                     f"{r['seconds_per_second']:>10.4f}{substeps}")
+    base, best = largest_dt(rows)
+    lines.append(f"\nLargest dt at the error of {base['integrator']} with dt={base['dt']:g}:")
+    for name, row in best.items():
+        lines.append(f"  {name:<10} dt={row['dt']:g} ({row['dt'] / base['dt']:g}x), "
+                     f"cost {row['seconds_per_second'] / base['seconds_per_second']:.2f}x")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="main.py converge",
+                                     description="Strong convergence of the integrators against a fine-dt reference")
+    parser.add_argument("--model", default="SATG")
+    parser.add_argument("--sigma", type=float, default=0.3)
+    parser.add_argument("-n", "--vehicles", type=int, default=22)
+    parser.add_argument("-L", "--length", type=float, default=231.0)
+    parser.add_argument("--horizon", type=float, default=20.0, help="simulated seconds compared, a multiple of every --dt [s]")
+    parser.add_argument("--dt", nargs="+", type=float, default=[0.05, 0.1, 0.2, 0.4])
+    parser.add_argument("--integrators", nargs="+", choices=list(STEPPERS) + ["adaptive"],
+                        default=list(STEPPERS) + ["adaptive"])
+    parser.add_argument("--reference-dt", type=float, default=0.05 / 64)
+    parser.add_argument("--paths", type=int, default=8)
+    parser.add_argument("--tolerance", type=float, default=1e-2, help="error tolerance of the adaptive scheme")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    try:
+        rows = convergence_report(args.model, args.sigma, args.vehicles, args.length, args.horizon, args.dt,
+                                  args.integrators, args.reference_dt, args.paths, tolerance=args.tolerance,
+                                  seed=args.seed)
+    except ValueError as error:
+        parser.error(str(error))
+    print(format_report(rows))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,205 @@
-from ui import main
+"""Command line entry point.
+
+    python main.py                 start the GUI (same as `python main.py gui`)
+    python main.py run ...         headless simulation, see `python main.py run -h`
+    python main.py sweep ...       parameter sweep (sweep.py)
+    python main.py bench ...       throughput benchmark (bench.py)
+    python main.py converge ...    integrator convergence report (integrators.py)
+    python main.py stability ...   linear stability of the uniform flow (stability.py)
+
+Subcommands import what they need when they run. `run`, `sweep`,
+`converge`, `stability` and the engine and ensemble suites of `bench`
+only need numpy. PyQt5 and matplotlib are imported for `gui`, `run --plot`
+and the gui suite of `bench`, which the full `bench` includes.
+"""
+import argparse
+import json
+import sys
+
+COMMANDS = ("run", "sweep", "bench", "converge", "stability", "gui")
+# Defaults of the `run` options that --restore takes from the checkpoint unless they are given
+RUN_DEFAULTS = {"model": "SATG", "sigma": 0.6, "dt": 0.05, "integrator": "euler", "tolerance": 1e-2,
+                "fast_math": False, "streams": "sequential"}
+
+
+def run(argv=None):
+    parser = argparse.ArgumentParser(prog="main.py run", description="Run one simulation without the GUI")
+    # Options without a fixed default are None when not given, see RUN_DEFAULTS and --restore
+    parser.add_argument("--model", default=None, help="default: SATG")
+    parser.add_argument("--sigma", type=float, default=None, help="default: 0.6")
+    parser.add_argument("--seed", type=int, default=None, help="default: 0")
+    parser.add_argument("-n", "--vehicles", type=int, default=None, help="default: 22")
+    parser.add_argument("-L", "--length", type=float, default=None, help="circuit length [m] (default: 231)")
+    parser.add_argument("--dt", type=float, default=None, help="default: 0.05")
+    parser.add_argument("--steps", type=int, default=6000)
+    parser.add_argument("--integrator", default=None, choices=("euler", "heun", "milstein", "adaptive"),
+                        help="time integration scheme (see integrators.py; default: euler)")
+    parser.add_argument("--tolerance", type=float, default=None,
+                        help="error tolerance of --integrator adaptive (default: 0.01)")
+    parser.add_argument("--fast-math", action="store_true", default=None,
+                        help="lookup tables for the smooth model functions, errors below 1e-7 (see fastmath.py)")
+    parser.add_argument("--streams", default=None, choices=("sequential", "counter"),
+                        help="noise from one sequential generator (default), or as a function of (seed, step, vehicle)")
+    parser.add_argument("--perturb", type=float, default=None, metavar="TIME",
+                        help="brake the last vehicle at this simulated time [s]")
+    parser.add_argument("--output", default=None, metavar="DIR",
+                        help="stream the trajectories to a recording directory (see recording.py)")
+    parser.add_argument("--record-every", type=int, default=1, help="record every k-th step")
+    parser.add_argument("--warmup", type=float, default=None, metavar="SECONDS",
+                        help="start of the time averages in the summary (default: the last quarter of the run; "
+                             "with stop rules at most one --stop-window or half the --jam-duration)")
+    parser.add_argument("--per-vehicle", default=None, metavar="FILE",
+                        help="write the per-vehicle speed mean and variance as JSON to FILE")
+    parser.add_argument("--jam-speed", type=float, default=1.0, help="vehicles slower than this are jammed [m/s]")
+    parser.add_argument("--stop-window", type=float, default=None, metavar="SECONDS",
+                        help="stop once mean speed and gap SD settle between windows this long (see stopping.py)")
+    parser.add_argument("--stop-tolerance", type=float, default=0.02, help="relative tolerance of --stop-window")
+    parser.add_argument("--stop-atol", type=float, default=0.05, help="absolute tolerance of --stop-window")
+    parser.add_argument("--stop-windows", type=int, default=3,
+                        help="consecutive windows without a trend needed to stop")
+    parser.add_argument("--stop-warmup", type=float, default=None, metavar="SECONDS",
+                        help="earliest stationary stop (default: four linear growth times of the configuration)")
+    parser.add_argument("--jam-duration", type=float, default=None, metavar="SECONDS",
+                        help="stop once stop-and-go has persisted this long")
+    parser.add_argument("--restore", default=None, metavar="FILE",
+                        help="continue from a checkpoint with its configuration; -n, -L and --seed cannot be given, "
+                             "--model, --sigma, --dt, --integrator, --tolerance, --fast-math and --streams "
+                             "replace the saved values when given")
+    parser.add_argument("--warm-start", type=float, default=None, metavar="SECONDS",
+                        help="begin after this much simulated time, from the warm-start cache when possible")
+    parser.add_argument("--checkpoint", default=None, metavar="FILE", help="save the final state (see checkpoint.py)")
+    parser.add_argument("--summary", default=None, metavar="FILE", help="write the summary as JSON (default: stdout)")
+    parser.add_argument("--plot", default=None, metavar="PREFIX",
+                        help="save PREFIX_trajectories.png and PREFIX_time_series.png")
+    parser.add_argument("--profile", nargs="?", const="", default=None, metavar="FILE",
+                        help="time the phases of each step; print a table to stderr (and write JSON to FILE)")
+    args = parser.parse_args(argv)
+
+    import numpy as np
+    from simulation import VehicleSimulation, Perturbation
+    from observables import default_observables, observe_results
+    from spectral import WaveSpectrum
+    from stopping import default_rules
+
+    # Only keep the history in memory when it is plotted
+    history_capacity = None if args.plot else 1
+    given = {key: getattr(args, key) for key in RUN_DEFAULTS if getattr(args, key) is not None}
+    if args.restore:
+        fixed = [flag for flag, value in (("-n", args.vehicles), ("-L", args.length), ("--seed", args.seed))
+                 if value is not None]
+        if fixed:
+            parser.error(f"{', '.join(fixed)} cannot be combined with --restore, the checkpoint fixes them")
+        from checkpoint import load_checkpoint
+        sim = load_checkpoint(args.restore, history_capacity=history_capacity, **given)
+    else:
+        sim = VehicleSimulation(n_vehicles=22 if args.vehicles is None else args.vehicles,
+                                circuit_length=231.0 if args.length is None else args.length,
+                                seed=0 if args.seed is None else args.seed, history_capacity=history_capacity,
+                                **{**RUN_DEFAULTS, **given})
+    if args.warm_start:
+        sim.warm_up(int(round(args.warm_start / sim.dt)))
+    if args.output:
+        sim.stream_to(args.output)
+    if args.profile is not None:
+        from profiling import PhaseProfiler
+        sim.profiler = PhaseProfiler()
+    if args.warmup is None:
+        # A stop rule may end the run before its last quarter. A stationary stop needs windows + 1 windows,
+        # so averages from the end of the first always get samples; a jam stop needs at least jam_duration
+        starts = [0.75 * args.steps * sim.dt]
+        if args.stop_window is not None:
+            starts.append(args.stop_window)
+        if args.jam_duration is not None:
+            starts.append(0.5 * args.jam_duration)
+        warmup = sim.time + min(starts)
+    else:
+        warmup = sim.time + args.warmup
+    sim.observables = (default_observables(warmup, args.jam_speed, per_vehicle=args.per_vehicle is not None)
+                       + [WaveSpectrum(warmup=warmup)])
+    perturbations = [] if args.perturb is None else [Perturbation(time=args.perturb)]
+    rules = default_rules(args.stop_window, args.stop_tolerance, args.jam_duration, args.jam_speed,
+                          warmup=args.stop_warmup, atol=args.stop_atol, windows=args.stop_windows)
+    report = sim.run(args.steps, perturbations=perturbations, record_every=args.record_every, stop=rules)
+    sim.close_stream()
+    if args.checkpoint:
+        from checkpoint import save_checkpoint
+        save_checkpoint(sim, args.checkpoint)
+
+    results = observe_results(sim.observables)
+    if args.per_vehicle:
+        with open(args.per_vehicle, "w") as f:
+            json.dump(results.pop("speed_per_vehicle"), f)
+    if sim.time < warmup:
+        print(f"warning: the run stopped at {sim.time:g} s, before the averages start at {warmup:g} s",
+              file=sys.stderr)
+
+    summary = {
+        "model": sim.model,
+        "sigma": sim.sigma,
+        "seed": sim.seed,
+        "n_vehicles": sim.n,
+        "circuit_length": sim.L,
+        "dt": sim.dt,
+        "steps": args.steps,
+        "time": sim.time,
+        "stop_reason": report["reason"],
+        "mean_speed": float(np.mean(sim.speed)),
+        "gap_sd": float(np.std(sim.gap)),
+        "min_speed": float(np.min(sim.speed)),
+        "warmup": warmup,
+        "warmup_reached": sim.time >= warmup,
+        "observables": results,
+    }
+    if args.summary:
+        with open(args.summary, "w") as f:
+            json.dump(summary, f, indent=2)
+    else:
+        print(json.dumps(summary))
+
+    if sim.profiler is not None:
+        print(sim.profiler.table(), file=sys.stderr)
+        if args.profile:
+            sim.profiler.dump(args.profile)
+
+    if args.plot:
+        import matplotlib
+        matplotlib.use("Agg")
+        from plots import plot_trajectories, plot_time_series
+        plot_trajectories(sim.history, sim.L).savefig(args.plot + "_trajectories.png")
+        plot_time_series(sim.history).savefig(args.plot + "_time_series.png")
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    # Only a bare `python main.py` defaults to the GUI; anything else must name a subcommand
+    parser = argparse.ArgumentParser(prog="main.py", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=COMMANDS, help="subcommand; `main.py COMMAND -h` for its options")
+    parser.add_argument("args", nargs=argparse.REMAINDER, help=argparse.SUPPRESS)
+    if argv and argv[0].startswith("-") and argv[0] not in ("-h", "--help"):
+        parser.error(f"expected a subcommand before {argv[0]}")
+    args = parser.parse_args(argv or ["gui"])
+    command, rest = args.command, args.args
+    if command == "gui" and rest:
+        parser.error(f"gui takes no arguments, got {' '.join(rest)}")
+    if command == "run":
+        run(rest)
+    elif command == "sweep":
+        from sweep import main as sweep_main
+        sweep_main(rest)
+    elif command == "bench":
+        from bench import main as bench_main
+        bench_main(rest)
+    elif command == "converge":
+        from integrators import main as converge_main
+        converge_main(rest)
+    elif command == "stability":
+        from stability import main as stability_main
+        stability_main(rest)
+    else:
+        from ui import main as gui_main
+        gui_main()
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,142 @@
+"""Car-following models and the registry used to look them up by name.
+
+Each model is an acceleration function ``f(g, v, dv, **params)`` evaluated on
+whole arrays (g = net gap, v = speed, dv = leader speed - own speed) together
+with named parameter values. Simulations resolve a model once, when it is
+set, instead of comparing model names on every step.
+"""
+import numpy as np
+from utils import tanh, Z, logsumexp
+
+
+def optimal_velocity(s):
+    return 13.7 * tanh(s / 20 - 0.5) + 6.3
+
+
+def ovm(g, v, dv, tau):
+    # Optimal velocity model [Bando et al. 1995]
+    return (optimal_velocity(g) - v) / tau
+
+
+def fvdm(g, v, dv, tau, kappa):
+    # Full velocity difference model [Jiang et al. 2001]
+    return (optimal_velocity(g) - v) / tau + dv / kappa
+
+
+def tomer(g, v, dv, K, T=2, D=5, v0=20):
+    # Tomer et al. 2000
+    return K * (1 - (v * T + D) / (g + D)) - (Z(-dv)) ** 2 / 2 / g - 2 * Z(v - v0)
+
+
+def idm(g, v, dv, A, a=2, s0=2, T=1, v0=20, delta=4):
+    # f(v_n,Dv_n) = s0 + T v_n - v_n * Dv_n / A [Treiber et al. 2000]
+    # v = GEschwidigkeit, v0 = Wunschgeschwindigkeit, g = gap = Nettoabstand
+    f = s0 + T * v - v * dv / A
+    return a * (1 - (f / g) ** 2 - (v / v0) ** delta)
+
+
+def atg(g, v, dv, gamma=0.2, T_min=0.1, T_max=4, eps=0.01):
+    # Adaptive time gap model [Tordeux et al. 2010]
+    # Time gap bounded to [T_min, T_max] exactly as in NetLogo
+    bounded_time_gap = logsumexp(logsumexp(g / logsumexp(v, 1e-10, eps), T_max, -eps), T_min, eps)
+    return (gamma * (g - v) + dv) / bounded_time_gap
+
+
+class Model:
+    """A named acceleration function with its parameter values"""
+
+    def __init__(self, name, accel, **params):
+        self.name = name
+        self.accel = accel
+        self.params = params
+
+    def acceleration(self, g, v, dv):
+        return self.accel(g, v, dv, **self.params)
+
+    def with_params(self, name=None, **params):
+        """Copy of the model with some parameters changed"""
+        if name is None:
+            changed = ", ".join(f"{k}={v}" for k, v in params.items())
+            name = f"{self.name} ({changed})"
+        return Model(name, self.accel, **{**self.params, **params})
+
+    def __repr__(self):
+        params = ", ".join(f"{k}={v}" for k, v in self.params.items())
+        return f"Model({self.name!r}, {self.accel.__name__}, {params})"
+
+
+_REGISTRY = {}
+
+
+def register_model(model, replace=False):
+    """Make a model available by name, e.g. in VehicleSimulation(model=name) and the GUI"""
+    if model.name in _REGISTRY and not replace:
+        raise ValueError(f"Model {model.name!r} is already registered")
+    _REGISTRY[model.name] = model
+    return model
+
+
+def get_model(model):
+    """Resolve a model name (or pass through a Model)"""
+    if isinstance(model, Model):
+        return model
+    try:
+        return _REGISTRY[model]
+    except KeyError:
+        raise ValueError(f"Unknown model {model!r}; registered models: {model_names()}") from None
+
+
+def model_names():
+    return list(_REGISTRY)
+
+
+def index_groups(models):
+    """Group a per-vehicle (or per-replica) model assignment: list of (Model, indices)"""
+    groups = {}
+    for i, model in enumerate(models):
+        groups.setdefault(get_model(model), []).append(i)
+    return [(model, np.array(indices)) for model, indices in groups.items()]
+
+
+def grouped_acceleration(groups, g, v, dv):
+    """Acceleration with one array pass per model; groups index the first axis"""
+    if len(groups) == 1:
+        return groups[0][0].acceleration(g, v, dv)
+    acc = np.empty_like(v)
+    for model, indices in groups:
+        acc[indices] = model.acceleration(g[indices], v[indices], dv[indices])
+    return acc
+
+
+def mixed_fleet(n_vehicles, shares, seed=None):
+    """Random per-vehicle model assignment, e.g. mixed_fleet(22, {"SATG": 0.1, "SIDM": 0.9})
+
+    The shares must be non-negative and sum to 1.
+    """
+    names = list(shares)
+    values = np.array([shares[name] for name in names], dtype=float)
+    if np.any(values < 0) or abs(values.sum() - 1) >= 1e-9:
+        raise ValueError(f"fleet shares must be non-negative and sum to 1, got {dict(shares)}")
+    counts = np.floor(values * n_vehicles).astype(int)
+    # Hand out the vehicles lost to rounding to the largest shares
+    for k in np.argsort([-shares[name] for name in names])[:n_vehicles - counts.sum()]:
+        counts[k] += 1
+    fleet = np.repeat(np.array(names, dtype=object), counts)
+    if len(fleet) != n_vehicles:
+        raise ValueError(f"fleet shares {dict(shares)} do not split {n_vehicles} vehicles")
+    np.random.default_rng(seed).shuffle(fleet)
+    return list(fleet)
+
+
+for _model in [
+    Model("SOVM", ovm, tau=0.5),
+    Model("SOVM unstable", ovm, tau=1.0),
+    Model("SFVDM", fvdm, tau=2.5, kappa=2.0),
+    Model("SFVDM unstable", fvdm, tau=2.5, kappa=2.7),
+    Model("Tomer et al.", tomer, K=7),
+    Model("Tomer et al. unstable", tomer, K=3),
+    Model("SIDM", idm, A=4),
+    Model("SIDM unstable", idm, A=5),
+    Model("SATG", atg),
+]:
+    register_model(_model)
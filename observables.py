@@ -0,0 +1,320 @@
+"""Online observables, updated from the simulation state after every step.
+
+An observable has ``update(sim)``, called once per step, and ``result()``,
+a dict of the statistics collected so far. Updates are O(n) and keep no
+trajectories, so long and large runs can report results with
+``history_capacity=1`` (or ``record_history=False`` for ensembles).
+
+Observables work along the last axis of the state arrays, so the same
+objects serve a VehicleSimulation (``x`` of shape (n,)) and an
+EnsembleSimulation (``(R, n)``, one statistic per replica).
+
+    sim = VehicleSimulation(history_capacity=1)
+    sim.observables = default_observables(warmup=100.0)
+    sim.run(6000, record_every=0)
+    summary = observe_results(sim.observables)
+"""
+import numpy as np
+
+# A vehicle slower than this counts as jammed (m/s), as in sweep.py
+JAM_SPEED = 1.0
+
+
+class RunningMoments:
+    """Welford running mean and variance of equally shaped samples"""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = None
+        self._m2 = None
+
+    def update(self, value):
+        value = np.asarray(value, dtype=float)
+        self.count += 1
+        if self.mean is None:
+            self.mean = value.copy()
+            self._m2 = np.zeros_like(self.mean)
+            return
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+
+    @property
+    def variance(self):
+        """Population variance of the samples so far"""
+        if self.count == 0:
+            return None
+        return self._m2 / self.count
+
+    def select(self, replicas):
+        if self.mean is not None:
+            self.mean = self.mean[replicas]
+            self._m2 = self._m2[replicas]
+
+
+# Per-ring scalars: functions of the state, one value per ring
+def mean_speed(sim):
+    return np.mean(sim.speed, axis=-1)
+
+
+def gap_sd(sim):
+    return np.std(sim.gap, axis=-1)
+
+
+def flow(sim):
+    # Vehicles passing a point per second: density * mean speed
+    return np.sum(sim.speed, axis=-1) / sim.L
+
+
+def jam_fraction(sim, jam_speed=JAM_SPEED):
+    return np.mean(sim.speed < jam_speed, axis=-1)
+
+
+SCALARS = {"mean_speed": mean_speed, "gap_sd": gap_sd, "flow": flow, "jam_fraction": jam_fraction}
+
+
+def _select(value, replicas):
+    return None if value is None else value[replicas]
+
+
+def _value(value):
+    # Plain floats for a single ring, lists for ensembles (JSON friendly)
+    if value is None:
+        return None
+    value = np.asarray(value)
+    return float(value) if value.ndim == 0 else value.tolist()
+
+
+class Observable:
+    """Base class: statistics are collected from `warmup` seconds of simulated time on"""
+
+    name = "observable"
+
+    def __init__(self, warmup=0.0):
+        self.warmup = warmup
+        self.reset()
+
+    def reset(self):
+        pass
+
+    def update(self, sim):
+        if sim.time >= self.warmup:
+            self.observe(sim)
+
+    def observe(self, sim):
+        raise NotImplementedError
+
+    def result(self):
+        raise NotImplementedError
+
+    def select(self, replicas):
+        """Keep the statistics of the given replicas only (see EnsembleSimulation.select)"""
+        raise NotImplementedError
+
+
+class TimeAverage(Observable):
+    """Time mean, variance, minimum and maximum of a per-ring scalar (see SCALARS)"""
+
+    def __init__(self, scalar="mean_speed", warmup=0.0):
+        self.scalar = scalar
+        self.function = SCALARS[scalar] if isinstance(scalar, str) else scalar
+        self.name = scalar if isinstance(scalar, str) else scalar.__name__
+        super().__init__(warmup)
+
+    def reset(self):
+        self.moments = RunningMoments()
+        self.min = None
+        self.max = None
+
+    def observe(self, sim):
+        value = self.function(sim)
+        self.moments.update(value)
+        self.min = value if self.min is None else np.minimum(self.min, value)
+        self.max = value if self.max is None else np.maximum(self.max, value)
+
+    def select(self, replicas):
+        self.moments.select(replicas)
+        self.min = _select(self.min, replicas)
+        self.max = _select(self.max, replicas)
+
+    def result(self):
+        return {"mean": _value(self.moments.mean), "variance": _value(self.moments.variance),
+                "min": _value(self.min), "max": _value(self.max), "samples": self.moments.count}
+
+
+class VehicleMoments(Observable):
+    """Per-vehicle time mean and variance of a vehicle field ("speed", "gap", ...)"""
+
+    def __init__(self, field="speed", warmup=0.0):
+        self.field = field
+        self.name = f"{field}_per_vehicle"
+        super().__init__(warmup)
+
+    def reset(self):
+        self.moments = RunningMoments()
+
+    def observe(self, sim):
+        self.moments.update(getattr(sim, self.field))
+
+    def select(self, replicas):
+        self.moments.select(replicas)
+
+    def result(self):
+        return {"mean": _value(self.moments.mean), "variance": _value(self.moments.variance),
+                "samples": self.moments.count}
+
+
+def count_clusters(jammed):
+    """Number of runs of consecutive True entries around the ring (along the last axis)"""
+    starts = jammed & ~np.roll(jammed, 1, axis=-1)
+    clusters = np.sum(starts, axis=-1)
+    # A ring that is jammed everywhere is one cluster without a start
+    return np.where(np.all(jammed, axis=-1), 1, clusters)
+
+
+class JamClusters(Observable):
+    """Number and size of jams: runs of neighbouring vehicles slower than jam_speed"""
+
+    name = "jams"
+
+    def __init__(self, jam_speed=JAM_SPEED, warmup=0.0):
+        self.jam_speed = jam_speed
+        super().__init__(warmup)
+
+    def reset(self):
+        self.clusters = RunningMoments()
+        self.jammed = RunningMoments()
+        self.max_clusters = None
+        self.current = None
+
+    def observe(self, sim):
+        jammed = sim.speed < self.jam_speed
+        clusters = count_clusters(jammed)
+        jammed_vehicles = np.sum(jammed, axis=-1)
+        self.current = clusters
+        self.clusters.update(clusters)
+        self.jammed.update(jammed_vehicles)
+        self.max_clusters = clusters if self.max_clusters is None else np.maximum(self.max_clusters, clusters)
+
+    def select(self, replicas):
+        self.clusters.select(replicas)
+        self.jammed.select(replicas)
+        self.max_clusters = _select(self.max_clusters, replicas)
+        self.current = _select(self.current, replicas)
+
+    def result(self):
+        mean_size = None
+        if self.clusters.count:
+            with np.errstate(invalid="ignore", divide="ignore"):
+                mean_size = np.where(self.clusters.mean > 0, self.jammed.mean / self.clusters.mean, 0.0)
+        return {"clusters": _value(self.current), "mean_clusters": _value(self.clusters.mean),
+                "max_clusters": _value(self.max_clusters), "mean_jammed_vehicles": _value(self.jammed.mean),
+                "mean_cluster_size": _value(mean_size), "samples": self.clusters.count}
+
+
+class WaveSpeed(Observable):
+    """Propagation speed of a single jam, in the lab frame (m/s).
+
+    Only samples where the ring has exactly one jam cluster (see
+    JamClusters) count: then the slowest vehicle is inside that jam. Its
+    position, unwrapped across the periodic boundary, is fitted against
+    time by running moments within each uninterrupted single-jam stretch,
+    and the stretches are pooled into one slope. Stop-and-go waves move
+    upstream, so the speed is negative. Rings that never had a single jam
+    for two samples report None; several jams at once are better served
+    by the phase speed of spectral.WaveSpectrum.
+    """
+
+    name = "wave_speed"
+
+    def __init__(self, jam_speed=JAM_SPEED, warmup=0.0):
+        self.jam_speed = jam_speed
+        super().__init__(warmup)
+
+    def reset(self):
+        self._last = None
+        # Per ring: whether a single-jam stretch is running, and its unwrapping offset
+        self._active = None
+        self._offset = None
+        # Running means and co-moments of (time, position) in the current stretch, Welford style
+        self._count = None
+        self._t_mean = None
+        self._t_m2 = None
+        self._x_mean = None
+        self._tx_m2 = None
+        # Co-moments of the finished stretches and samples used
+        self._t_total = None
+        self._tx_total = None
+        self.count = None
+        self._single_ring = None
+
+    def _close(self, rings):
+        self._t_total[rings] += self._t_m2[rings]
+        self._tx_total[rings] += self._tx_m2[rings]
+        self._active[rings] = False
+
+    def observe(self, sim):
+        jammed = sim.speed < self.jam_speed
+        single = np.atleast_1d(count_clusters(jammed) == 1) & np.atleast_1d(np.any(jammed, axis=-1))
+        slowest = np.argmin(sim.speed, axis=-1)
+        position = np.atleast_1d(np.take_along_axis(sim.x, np.asarray(slowest)[..., None], axis=-1)[..., 0])
+        if self._last is None:
+            self._single_ring = np.ndim(sim.speed) == 1
+            shape = position.shape
+            self._active = np.zeros(shape, dtype=bool)
+            self.count = np.zeros(shape, dtype=int)
+            for name in ("_offset", "_count", "_t_mean", "_t_m2", "_x_mean", "_tx_m2", "_t_total", "_tx_total"):
+                setattr(self, name, np.zeros(shape))
+        self._close(self._active & ~single)
+        start = single & ~self._active
+        for name in ("_offset", "_count", "_t_mean", "_t_m2", "_x_mean", "_tx_m2"):
+            getattr(self, name)[start] = 0.0
+        # Unwrap within a stretch: the jam moves much less than half a lap per step
+        going = single & self._active
+        if going.any():
+            self._offset[going] -= sim.L * np.round((position[going] - self._last[going]) / sim.L)
+        self._active = single
+        self._last = position
+        unwrapped = position + self._offset
+        self._count[single] += 1
+        self.count[single] += 1
+        dt = np.where(single, sim.time - self._t_mean, 0.0)
+        n = np.maximum(self._count, 1)
+        self._t_mean += dt / n
+        self._t_m2 += dt * (sim.time - self._t_mean)
+        self._x_mean += np.where(single, unwrapped - self._x_mean, 0.0) / n
+        self._tx_m2 += dt * np.where(single, unwrapped - self._x_mean, 0.0)
+
+    def select(self, replicas):
+        for name in ("_last", "_active", "_offset", "_count", "_t_mean", "_t_m2", "_x_mean", "_tx_m2",
+                     "_t_total", "_tx_total", "count"):
+            setattr(self, name, _select(getattr(self, name), replicas))
+
+    def result(self):
+        if self._last is None:
+            return {"speed": None, "samples": 0}
+        t_m2 = self._t_total + np.where(self._active, self._t_m2, 0.0)
+        tx_m2 = self._tx_total + np.where(self._active, self._tx_m2, 0.0)
+        speed = [float(tx / t) if t > 0 else None for t, tx in zip(t_m2, tx_m2)]
+        samples = self.count.tolist()
+        # Plain values for a single ring
+        if self._single_ring:
+            return {"speed": speed[0], "samples": samples[0]}
+        return {"speed": speed, "samples": samples}
+
+
+def default_observables(warmup=0.0, jam_speed=JAM_SPEED, per_vehicle=False):
+    """Time averages of the SCALARS, jam clusters, wave speed and, if per_vehicle, per-vehicle speed moments.
+
+    The per-vehicle moments hold n values per statistic, too many to print
+    for large rings, so they are only included on request.
+    """
+    observables = [TimeAverage(name, warmup) for name in SCALARS]
+    if per_vehicle:
+        observables.append(VehicleMoments("speed", warmup))
+    return observables + [JamClusters(jam_speed, warmup), WaveSpeed(jam_speed, warmup)]
+
+
+def observe_results(observables):
+    """Results of several observables as {name: result}"""
+    return {obs.name: obs.result() for obs in observables}
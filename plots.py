@@ -3,10 +3,181 @@ import matplotlib.pyplot as plt
 from matplotlib.patches import Circle, Rectangle
 from matplotlib.figure import Figure
 
+# Upper bound on trajectory lines drawn; larger rings show an evenly spread subset
+MAX_TRAJECTORIES = 200
+
+def default_highlight(n_vehicles):
+    """The blue vehicle: the last one, like VehicleSimulation.apply_perturbation"""
+    return [n_vehicles - 1]
+
+def ring_positions(x, circuit_length):
+    """(n, 2) coordinates of the vehicles on the drawn circle"""
+    radius = circuit_length/(2*np.pi)
+    angles = 2 * np.pi * np.asarray(x) / circuit_length
+    return np.column_stack([radius * np.cos(angles), radius * np.sin(angles)])
+
+class VehicleMarkers:
+    """All vehicles on the ring drawn with two marker-only Line2D artists.
+
+    One artist holds every vehicle, the other the highlighted ones in blue
+    on top. Line2D markers draw much faster than a per-point scatter, so
+    the cost stays low at 10^5 vehicles.
+    """
+
+    def __init__(self, ax, circuit_length, n_vehicles, highlight, size=8, highlight_size=10):
+        self.circuit_length = circuit_length
+        self.highlight = np.asarray(highlight, dtype=int)
+        # Shrink markers on crowded rings
+        size = size * max(0.15, min(1.0, (22.0 / n_vehicles) ** 0.5))
+        self.line, = ax.plot([], [], 'ko', markersize=size, linestyle='none')
+        self.highlight_line, = ax.plot([], [], 'bo', markersize=highlight_size, linestyle='none', zorder=3)
+        self.update(np.zeros(n_vehicles))
+
+    def update(self, x):
+        pos = ring_positions(x, self.circuit_length)
+        self.line.set_data(pos[:, 0], pos[:, 1])
+        self.highlight_line.set_data(pos[self.highlight, 0], pos[self.highlight, 1])
+
+    @property
+    def artists(self):
+        return [self.line, self.highlight_line]
+
+def trajectory_vehicles(n_vehicles, highlight, max_lines=MAX_TRAJECTORIES):
+    """Vehicles drawn in a trajectory panel: the highlighted ones plus an evenly spread subset"""
+    stride = max(1, -(-n_vehicles // max_lines))
+    return np.union1d(np.arange(0, n_vehicles, stride), highlight).astype(int)
+
+def _joined_lines(values, time):
+    """Flatten a (steps, m) series into m polylines separated by NaN, for one Line2D"""
+    m = values.shape[1]
+    ys = np.full((m, len(time) + 1), np.nan)
+    ys[:, :-1] = values.T
+    ts = np.full((m, len(time) + 1), np.nan)
+    ts[:, :-1] = time
+    return ys.ravel(), ts.ravel()
+
+def _break_wraps(values, period):
+    """Replace points right after a wrap-around with NaN so no line crosses the plot"""
+    values = np.array(values, dtype=float)
+    jumps = np.abs(np.diff(values, axis=0)) >= period / 2
+    values[1:][jumps] = np.nan
+    return values
+
+class TrajectoryLines:
+    """Space-time trajectories of selected vehicles, drawn with two Line2D artists.
+
+    Each group (highlighted / other vehicles) keeps its positions in a
+    preallocated NaN-filled (vehicles, frames) array: every row is one
+    vehicle's polyline, and unused columns and wrap-arounds are line breaks.
+    Positions are centered on the ring, i.e. in [-L/2, L/2).
+    """
+
+    def __init__(self, ax, circuit_length, vehicles, highlight, line_kw=None, highlight_kw=None,
+                 capacity=1024):
+        self.circuit_length = circuit_length
+        is_highlight = np.isin(vehicles, highlight)
+        self.groups = []
+        for rows, kw in ((vehicles[~is_highlight], line_kw or {'color': 'k', 'alpha': 0.5}),
+                         (vehicles[is_highlight], highlight_kw or {'color': 'b', 'linewidth': 2})):
+            line, = ax.plot([], [], '-', **kw)
+            self.groups.append({"vehicles": rows, "line": line})
+        self.capacity = capacity
+        self.clear()
+
+    def clear(self):
+        self.frames = 0
+        for group in self.groups:
+            m = len(group["vehicles"])
+            # One extra column that always stays NaN separates consecutive vehicles
+            group["x"] = np.full((m, self.capacity + 1), np.nan)
+            group["t"] = np.full((m, self.capacity + 1), np.nan)
+            group["last"] = np.full(m, np.nan)
+            group["line"].set_data([], [])
+
+    def _grow(self):
+        for group in self.groups:
+            for key in ("x", "t"):
+                grown = np.full((group[key].shape[0], 2 * self.capacity + 1), np.nan)
+                grown[:, :self.frames] = group[key][:, :self.frames]
+                group[key] = grown
+        self.capacity *= 2
+
+    def append(self, x, time):
+        """Add the current positions of all vehicles at the given time"""
+        if self.frames == self.capacity:
+            self._grow()
+        f = self.frames
+        half = self.circuit_length / 2
+        for group in self.groups:
+            pos = np.asarray(x)[group["vehicles"]] - half
+            # Break the line where the vehicle wrapped around
+            wrapped = np.abs(pos - group["last"]) >= half
+            group["last"] = pos
+            group["x"][:, f] = np.where(wrapped, np.nan, pos)
+            group["t"][:, f] = time
+            group["line"].set_data(group["x"].ravel(), group["t"].ravel())
+        self.frames += 1
+
+    @property
+    def artists(self):
+        return [group["line"] for group in self.groups]
+
+class SpaceTimeRaster:
+    """Space-time image of a vehicle field (e.g. speed or gap), drawn with one AxesImage.
+
+    The image is a preallocated (rows, bins) array covering [-L/2, L/2) x
+    [0, time_window). Each append averages the values of all vehicles per
+    space bin (empty bins take the value of the nearest occupied bin behind
+    them) and writes the row of the given time, filling any rows skipped
+    since the previous append, so the drawing cost depends on the image size
+    only, not on the number of vehicles or the window length.
+    """
+
+    def __init__(self, ax, circuit_length, time_window, bins=200, rows=200,
+                 cmap='RdYlGn', vmin=None, vmax=None):
+        self.circuit_length = circuit_length
+        self.time_window = time_window
+        self.bins = bins
+        self.rows = rows
+        self.values = np.full((rows, bins), np.nan)
+        self.image = ax.imshow(self.values, origin='lower', aspect='auto', interpolation='nearest',
+                               extent=(-circuit_length / 2, circuit_length / 2, 0, time_window),
+                               cmap=cmap, vmin=vmin, vmax=vmax)
+        self.clear()
+
+    def clear(self):
+        self.values.fill(np.nan)
+        # First row not written yet (None: nothing written since the last clear)
+        self.next_row = None
+        self.image.set_data(self.values)
+
+    def append(self, x, values, time):
+        """Add the field `values` of the vehicles at positions x at the given time"""
+        row = min(self.rows - 1, int(time / self.time_window * self.rows))
+        start = row if self.next_row is None else self.next_row
+        if row < start:
+            return
+        # Positions in [0, L) are drawn centered like TrajectoryLines, at x - L/2
+        index = np.minimum((np.asarray(x) * (self.bins / self.circuit_length)).astype(int), self.bins - 1)
+        counts = np.bincount(index, minlength=self.bins)
+        sums = np.bincount(index, weights=values, minlength=self.bins)
+        occupied = np.where(counts > 0, np.arange(self.bins), -1)
+        source = np.maximum.accumulate(occupied)
+        # Bins before the first vehicle continue from the last one around the ring
+        source[source < 0] = source[-1]
+        self.values[start:row + 1] = sums[source] / counts[source]
+        self.next_row = row + 1
+        self.image.set_data(self.values)
+
+    @property
+    def artists(self):
+        return [self.image]
+
 class SimulationPlotter:
-    def __init__(self, circuit_length=231.0, n_vehicles=22):
+    def __init__(self, circuit_length=231.0, n_vehicles=22, highlight=None):
         self.circuit_length = circuit_length
         self.n_vehicles = n_vehicles
+        self.highlight = default_highlight(n_vehicles) if highlight is None else list(highlight)
         self.setup_figures()
         
     def setup_figures(self):
@@ -22,18 +193,8 @@ class SimulationPlotter:
         self.live_ax.grid(True)
         self.live_ax.set_title("Live Simulation")
         
-        # Vehicle scatter plots
-        radius = self.circuit_length/(2*np.pi)
-        angles = np.zeros(self.n_vehicles)
-        x_pos = radius * np.cos(angles)
-        y_pos = radius * np.sin(angles)
-        self.vehicle_plots = []
-        for i in range(self.n_vehicles):
-            if i == 21:  # Special blue vehicle
-                plot, = self.live_ax.plot(x_pos[i], y_pos[i], 'bo', markersize=10)
-            else:
-                plot, = self.live_ax.plot(x_pos[i], y_pos[i], 'ko', markersize=8)
-            self.vehicle_plots.append(plot)
+        # All vehicles in one marker artist, highlighted ones in another
+        self.vehicle_markers = VehicleMarkers(self.live_ax, self.circuit_length, self.n_vehicles, self.highlight)
         
         # Trajectories figure
         self.traj_fig = Figure(figsize=(10, 6))
@@ -42,14 +203,13 @@ class SimulationPlotter:
         self.traj_ax.set_ylabel("Time [s]")
         self.traj_ax.set_title("Trajectories")
         self.traj_ax.grid(True)
-        self.traj_lines = []
-        for i in range(self.n_vehicles):
-            if i == 21:
-                line, = self.traj_ax.plot([], [], 'b-', linewidth=2)
-            else:
-                line, = self.traj_ax.plot([], [], 'k-', alpha=0.5)
-            self.traj_lines.append(line)
-        self.traj_ax.set_xlim(-115, 115)
+        self.traj_vehicles = trajectory_vehicles(self.n_vehicles, self.highlight)
+        is_highlight = np.isin(self.traj_vehicles, self.highlight)
+        self.traj_line, = self.traj_ax.plot([], [], 'k-', alpha=0.5)
+        self.traj_highlight_line, = self.traj_ax.plot([], [], 'b-', linewidth=2)
+        self.traj_groups = [(self.traj_line, self.traj_vehicles[~is_highlight]),
+                            (self.traj_highlight_line, self.traj_vehicles[is_highlight])]
+        self.traj_ax.set_xlim(-self.circuit_length/2, self.circuit_length/2)
         
         # Time series figure
         self.time_fig = Figure(figsize=(8, 8))
@@ -72,26 +232,22 @@ class SimulationPlotter:
         self.time_fig.tight_layout()
     
     def update_live_view(self, x):
-        radius = self.circuit_length/(2*np.pi)
-        angles = 2 * np.pi * x / self.circuit_length
-        for i, (angle, plot) in enumerate(zip(angles, self.vehicle_plots)):
-            x_pos = radius * np.cos(angle)
-            y_pos = radius * np.sin(angle)
-            plot.set_data([x_pos], [y_pos])
+        self.vehicle_markers.update(x)
         return self.live_fig
     
     def update_trajectories(self, history):
-        x = np.array(history["x"])
-        time = np.array(history["time"])
+        x = np.asarray(history["x"])
+        time = np.asarray(history["time"])
         
         # Update y-axis limits based on current time
         current_time = time[-1]
         window_start = max(0, current_time - 250)
         self.traj_ax.set_ylim(window_start, window_start + 250)
         
-        # Update trajectory lines
-        for i, line in enumerate(self.traj_lines):
-            line.set_data(x[:, i], time)
+        # Update trajectory lines, centered on the ring and broken at wrap-arounds
+        for line, vehicles in self.traj_groups:
+            centered = _break_wraps(x[:, vehicles] - self.circuit_length/2, self.circuit_length)
+            line.set_data(*_joined_lines(centered, time))
         
         return self.traj_fig
     
@@ -111,7 +267,7 @@ class SimulationPlotter:
         
         return self.time_fig
 
-def plot_live_simulation(x, circuit_length):
+def plot_live_simulation(x, circuit_length, highlight=None):
     """Plot the current state of vehicles on a circular track"""
     fig, ax = plt.subplots(figsize=(8, 8))
     
@@ -120,18 +276,10 @@ def plot_live_simulation(x, circuit_length):
     circle = Circle((0, 0), radius, fill=False, color='gray', linestyle='--')
     ax.add_patch(circle)
     
-    # Convert positions to angles and plot vehicles
-    angles = 2 * np.pi * x / circuit_length
-    for i, angle in enumerate(angles):
-        # Calculate vehicle position
-        x_pos = radius * np.cos(angle)
-        y_pos = radius * np.sin(angle)
-        
-        # Plot vehicle
-        if i == 21:  # Special blue vehicle
-            ax.plot(x_pos, y_pos, 'bo', markersize=10)
-        else:
-            ax.plot(x_pos, y_pos, 'ko', markersize=8)
+    # Plot all vehicles at once, highlighted vehicles in blue
+    n_vehicles = len(x)
+    highlight = default_highlight(n_vehicles) if highlight is None else list(highlight)
+    VehicleMarkers(ax, circuit_length, n_vehicles, highlight).update(x)
     
     # Set equal aspect ratio and limits
     ax.set_aspect('equal')
@@ -141,26 +289,35 @@ def plot_live_simulation(x, circuit_length):
     ax.set_title("Live Simulation")
     return fig
 
+def _time_slice(history, t_start=None, t_end=None, stride=1):
+    """Index slice of the recorded steps with t_start <= time <= t_end"""
+    time = np.asarray(history["time"])
+    start = 0 if t_start is None else int(np.searchsorted(time, t_start, side="left"))
+    end = len(time) if t_end is None else int(np.searchsorted(time, t_end, side="right"))
+    return slice(start, end, stride)
+
 # Trajectory plot (space vs. time, each line = one vehicle)
-def plot_trajectories(history, circuit_length):
+# history may be a simulation history or a recording.TrajectoryRecording;
+# t_start/t_end/stride select the part that is read and drawn
+# highlight selects the blue vehicles; at most MAX_TRAJECTORIES lines are drawn
+def plot_trajectories(history, circuit_length, t_start=None, t_end=None, stride=1, highlight=None):
     fig, ax = plt.subplots(figsize=(10, 8))
     
-    # Plot circular track
-    radius = circuit_length/(2*np.pi)
-    circle = Circle((0, 0), radius, fill=False, color='gray', linestyle='--')
-    ax.add_patch(circle)
-    
     # Plot vehicle trajectories
-    x = np.array(history["x"])
-    time = np.array(history["time"])
+    window = _time_slice(history, t_start, t_end, stride)
+    x = np.asarray(history["x"][window])
+    time = np.asarray(history["time"][window])
     
-    # Convert positions to angles and plot
-    angles = 2 * np.pi * x / circuit_length
-    for i in range(x.shape[1]):
-        if i == 21:  # Special blue vehicle
-            ax.plot(time, angles[:, i], 'b-', linewidth=2)
-        else:
-            ax.plot(time, angles[:, i], 'k-', alpha=0.5)
+    # Convert positions to angles and plot, one line artist per color
+    n_vehicles = x.shape[1]
+    highlight = default_highlight(n_vehicles) if highlight is None else list(highlight)
+    vehicles = trajectory_vehicles(n_vehicles, highlight)
+    is_highlight = np.isin(vehicles, highlight)
+    angles = _break_wraps(2 * np.pi * x[:, vehicles] / circuit_length, 2 * np.pi)
+    angle_data, time_data = _joined_lines(angles[:, ~is_highlight], time)
+    ax.plot(time_data, angle_data, 'k-', alpha=0.5)
+    angle_data, time_data = _joined_lines(angles[:, is_highlight], time)
+    ax.plot(time_data, angle_data, 'b-', linewidth=2)
     
     ax.set_xlabel("Time [s]")
     ax.set_ylabel("Position [rad]")
@@ -169,16 +326,18 @@ def plot_trajectories(history, circuit_length):
     return fig
 
 # Time series plot (mean speed, gap SD)
-def plot_time_series(history):
+def plot_time_series(history, t_start=None, t_end=None, stride=1):
     fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(8, 8))
+    window = _time_slice(history, t_start, t_end, stride)
+    time = np.asarray(history["time"][window])
     
     # Plot mean speed
-    ax1.plot(history["time"], history["mean_speed"], 'b-')
+    ax1.plot(time, np.asarray(history["mean_speed"][window]), 'b-')
     ax1.set_ylabel("Mean speed [m/s]")
     ax1.grid(True)
     
     # Plot gap standard deviation
-    ax2.plot(history["time"], history["gap_sd"], 'r-')
+    ax2.plot(time, np.asarray(history["gap_sd"][window]), 'r-')
     ax2.set_xlabel("Time [s]")
     ax2.set_ylabel("Gap SD [m]")
     ax2.grid(True)
@@ -0,0 +1,64 @@
+"""Opt-in per-phase timing.
+
+Code that supports profiling keeps an optional PhaseProfiler and marks the
+end of each phase:
+
+    prof = self.profiler
+    if prof is not None:
+        prof.start()
+    ...
+    if prof is not None:
+        prof.mark("gaps")
+
+Each mark adds the wall time since the previous mark (or start) to that
+phase. With the profiler set to None the cost is one comparison per phase.
+VehicleSimulation and the GUI frame loop are instrumented this way:
+
+    sim.profiler = PhaseProfiler()
+    sim.run(1000)
+    print(sim.profiler.table())
+"""
+import json
+import time as timer
+
+
+class PhaseProfiler:
+    """Accumulated wall time and number of calls per named phase"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.totals = {}
+        self.counts = {}
+        self._last = timer.perf_counter()
+
+    def start(self):
+        self._last = timer.perf_counter()
+
+    def mark(self, phase):
+        now = timer.perf_counter()
+        self.totals[phase] = self.totals.get(phase, 0.0) + now - self._last
+        self.counts[phase] = self.counts.get(phase, 0) + 1
+        self._last = now
+
+    def summary(self):
+        """One dict per phase, in the order the phases were first seen"""
+        # Copies, so another thread may keep marking meanwhile
+        totals, counts = dict(self.totals), dict(self.counts)
+        overall = sum(totals.values()) or 1.0
+        return [{"phase": phase, "calls": counts[phase], "total_s": total,
+                 "mean_us": 1e6 * total / counts[phase], "share": total / overall}
+                for phase, total in totals.items()]
+
+    def table(self):
+        lines = [f"{'phase':<14}{'calls':>9}{'total ms':>11}{'mean us':>10}{'share':>8}"]
+        for row in self.summary():
+            lines.append(f"{row['phase']:<14}{row['calls']:>9}{1e3 * row['total_s']:>11.1f}"
+                         f"{row['mean_us']:>10.1f}{100 * row['share']:>7.1f}%")
+        return "\n".join(lines)
+
+    def dump(self, path):
+        """Write the summary as JSON"""
+        with open(path, "w") as f:
+            json.dump(self.summary(), f, indent=2)
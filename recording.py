@@ -0,0 +1,123 @@
+"""Streaming trajectory recordings on disk.
+
+A recording is a directory holding one ``.npy`` file per history field
+(``x.npy``, ``speed.npy``, ``gap.npy``, ``mean_speed.npy``, ``gap_sd.npy``,
+``time.npy``) and a ``meta.json`` with the run configuration. The writer
+buffers a fixed number of steps in memory and appends them to the files
+chunk by chunk, rewriting each fixed-size ``.npy`` header with the current
+number of steps, so every file is a valid ``.npy`` after each chunk.
+The reader opens the files with ``np.memmap``, so only the slices that are
+actually used are read from disk.
+"""
+import json
+import os
+
+import numpy as np
+from history import FIELDS, VEHICLE_FIELDS
+
+META_FILE = "meta.json"
+# Bytes reserved for each .npy header, enough for any 2-D shape
+HEADER_SIZE = 128
+MAGIC = b"\x93NUMPY\x01\x00"
+
+
+def _npy_header(shape):
+    header = "{'descr': '<f8', 'fortran_order': False, 'shape': %s, }" % repr(tuple(shape))
+    pad = HEADER_SIZE - len(MAGIC) - 2 - len(header) - 1
+    header = (header + " " * pad + "\n").encode("latin1")
+    return MAGIC + np.uint16(len(header)).astype("<u2").tobytes() + header
+
+
+class TrajectoryWriter:
+    """Append-only writer for a recording directory"""
+
+    def __init__(self, path, n_vehicles, metadata=None, chunk_steps=1024):
+        self.path = path
+        self.n = n_vehicles
+        self.chunk_steps = chunk_steps
+        self.steps = 0
+        os.makedirs(path, exist_ok=True)
+        meta = dict(metadata or {})
+        meta.update({"n_vehicles": n_vehicles, "chunk_steps": chunk_steps, "fields": list(FIELDS)})
+        with open(os.path.join(path, META_FILE), "w") as f:
+            json.dump(meta, f, indent=2)
+        # One preallocated chunk buffer and one open file per field
+        self._buffers = {name: np.empty((chunk_steps, n_vehicles) if name in VEHICLE_FIELDS else chunk_steps,
+                                        dtype="<f8")
+                         for name in FIELDS}
+        self._files = {}
+        for name in FIELDS:
+            f = open(os.path.join(path, name + ".npy"), "wb+")
+            f.write(_npy_header(self._shape(name, 0)))
+            self._files[name] = f
+        self._fill = 0
+
+    def _shape(self, name, steps):
+        return (steps, self.n) if name in VEHICLE_FIELDS else (steps,)
+
+    def append(self, x, speed, gap, mean_speed, gap_sd, time):
+        """Record one step, same signature as History.append"""
+        row = self._fill
+        for name, value in zip(FIELDS, (x, speed, gap, mean_speed, gap_sd, time)):
+            self._buffers[name][row] = value
+        self._fill += 1
+        if self._fill == self.chunk_steps:
+            self.flush()
+
+    def flush(self):
+        """Write the buffered steps to disk and update the headers"""
+        if self._fill == 0:
+            return
+        steps = self.steps + self._fill
+        for name, f in self._files.items():
+            f.seek(0, os.SEEK_END)
+            f.write(self._buffers[name][:self._fill].tobytes())
+            f.seek(0)
+            f.write(_npy_header(self._shape(name, steps)))
+            f.flush()
+        self.steps = steps
+        self._fill = 0
+
+    def close(self):
+        if self._files:
+            self.flush()
+            for f in self._files.values():
+                f.close()
+            self._files = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class TrajectoryRecording:
+    """Memory-mapped view of a recording directory.
+
+    ``recording["x"]`` is an ``(steps, n)`` memmap, so it can be passed to
+    ``plots.plot_trajectories`` and ``plots.plot_time_series`` like a history.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, META_FILE)) as f:
+            self.metadata = json.load(f)
+        self._arrays = {name: np.load(os.path.join(path, name + ".npy"), mmap_mode="r")
+                        for name in self.metadata["fields"]}
+
+    def __getitem__(self, name):
+        return self._arrays[name]
+
+    def keys(self):
+        return tuple(self._arrays)
+
+    def __len__(self):
+        return len(self._arrays["time"])
+
+    def window(self, t_start=None, t_end=None, stride=1):
+        """Index slice of the steps with t_start <= time <= t_end"""
+        time = self._arrays["time"]
+        start = 0 if t_start is None else int(np.searchsorted(time, t_start, side="left"))
+        end = len(time) if t_end is None else int(np.searchsorted(time, t_end, side="right"))
+        return slice(start, end, stride)
@@ -1,167 +1,497 @@
 import numpy as np
-from utils import tanh, Z, logsumexp
+from utils import volatility
+import fastmath
+from models import optimal_velocity, get_model, index_groups, grouped_acceleration
+from history import History
+from recording import TrajectoryWriter
+from stopping import NO_STOP, check_rules
+from streams import CounterNoise
+
+VEHICLE_LENGTH = 5.0  # m
+MIN_GAP = 0.1  # m
+MIN_SPEED = 0.1  # m/s
+
+
+def ring_difference(a, out=None):
+    """a[i + 1] - a[i] around the ring (along the last axis)"""
+    if out is None:
+        out = np.empty_like(a)
+    np.subtract(a[..., 1:], a[..., :-1], out=out[..., :-1])
+    np.subtract(a[..., :1], a[..., -1:], out=out[..., -1:])
+    return out
+
+
+def compute_gaps(x, L, out=None):
+    """Net gaps to the vehicle ahead on the ring (works along the last axis)"""
+    gap = ring_difference(x, out)
+    # Periodic boundary: the leader may already have wrapped around
+    np.add(gap, L, out=gap, where=gap < 0)
+    # Subtract vehicle length and ensure minimum gap
+    np.subtract(gap, VEHICLE_LENGTH, out=gap)
+    return np.maximum(gap, MIN_GAP, out=gap)
+
+
+def enforce_spacing_ordered(new_x, L, min_dist=VEHICLE_LENGTH):
+    """Push leaders forward in place so no pair is closer than min_dist.
+
+    Same result as scanning i = 0..n-1 and moving vehicle i+1 to
+    new_x[i] + min_dist, but only visits pairs that are (or become) too close.
+    """
+    n = len(new_x)
+    dist = np.roll(new_x, -1) - new_x
+    dist[dist < 0] += L
+    last = -1
+    for i in np.flatnonzero(dist < min_dist):
+        if i <= last:
+            continue
+        # Follow the cascade: a push may bring the vehicle pushed into its own leader
+        while True:
+            next_i = (i + 1) % n
+            d = new_x[next_i] - new_x[i]
+            if d < 0:
+                d += L
+            if d >= min_dist:
+                break
+            new_x[next_i] = new_x[i] + min_dist
+            # Ensure periodic boundary
+            if new_x[next_i] >= L:
+                new_x[next_i] -= L
+            if next_i == 0:
+                break
+            i = next_i
+        last = i
+    return new_x
+
+
+def enforce_spacing_projection(new_x, L, min_dist=VEHICLE_LENGTH):
+    """Move vehicles forward in place to the closest positions with all spacings >= min_dist.
+
+    Vehicle i ends up at the largest of x[i - k] + k * min_dist over the k < n
+    vehicles behind it, the smallest fix-up that leaves every pair at least
+    min_dist apart. The result does not depend on which vehicle is index 0.
+    It is computed with a running maximum over two laps of the ring, along the
+    last axis, and needs L >= n * min_dist.
+    """
+    n = new_x.shape[-1]
+    rows = new_x.reshape(-1, n)
+    dist = np.roll(rows, -1, axis=1) - rows
+    dist[dist < 0] += L
+    crowded = np.flatnonzero((dist < min_dist).any(axis=1))
+    if len(crowded) == 0:
+        return new_x
+    x = rows[crowded]
+    # Unwrapped positions in ring order, and the same positions one lap later
+    travelled = np.cumsum(dist[crowded], axis=1)
+    lap = travelled[:, -1:]
+    u = x[:, :1] + np.concatenate([np.zeros((len(crowded), 1)), travelled[:, :-1]], axis=1)
+    offsets = np.arange(2 * n) * min_dist
+    w = np.concatenate([u, u + lap], axis=1) - offsets
+    reach = np.maximum.accumulate(w, axis=1)[:, n:]
+    # Only vehicles that are actually pushed move; the others keep their exact position
+    pushed = reach > w[:, n:]
+    target = reach + offsets[n:] - lap
+    rows[crowded] = np.where(pushed, x + (target - u), x)
+    return new_x
+
+
+SPACING_MODES = ("projection", "ordered")
+# Time integration schemes, see integrators.py
+INTEGRATORS = ("euler", "heun", "milstein", "adaptive")
+# Noise streams: one sequential generator per run, or counter-based (see streams.py)
+STREAMS = ("sequential", "counter")
+
+
+class Perturbation:
+    """Multiply the speed of one vehicle by `factor` at a given tick or simulated time.
+
+    Used as a schedule for VehicleSimulation.run; vehicle=None means the
+    highlighted (last) vehicle, like the GUI's perturbation button.
+    """
+
+    def __init__(self, vehicle=None, factor=0.2, tick=None, time=None):
+        if (tick is None) == (time is None):
+            raise ValueError("Give either tick or time")
+        self.vehicle = vehicle
+        self.factor = factor
+        self.tick = tick
+        self.time = time
+
+    def due_tick(self, sim):
+        """Tick of `sim` before which the perturbation is applied"""
+        if self.tick is not None:
+            return self.tick
+        return sim.tick + int(np.ceil((self.time - sim.time) / sim.dt - 1e-9))
+
+    def apply(self, sim):
+        sim.apply_perturbation(self.vehicle, self.factor)
+
 
 class VehicleSimulation:
-    def __init__(self, n_vehicles=22, circuit_length=231.0, dt=0.05, model="SATG", sigma=0.6, seed=0):
+    def __init__(self, n_vehicles=22, circuit_length=231.0, dt=0.05, model="SATG", sigma=0.6, seed=0,
+                 history_capacity=None, vehicle_models=None, spacing="projection", integrator="euler",
+                 tolerance=1e-2, fast_math=False, streams="sequential"):
+        # history_capacity=None keeps every step, an integer keeps only the last steps
+        self.history_capacity = history_capacity
         self.n = n_vehicles
         self.L = circuit_length
         self.dt = dt
+        # Mixed fleets: one model per vehicle, None entries follow `model`
+        self._vehicle_models = None if vehicle_models is None else list(vehicle_models)
+        if self._vehicle_models is not None and len(self._vehicle_models) != n_vehicles:
+            raise ValueError("vehicle_models needs one entry per vehicle")
+        # Tabulated and simplified model functions instead of the exact ones (see fastmath.py)
+        self._fast_math = fast_math
         self.model = model
+        # "ordered" reproduces results from before enforce_spacing_projection
+        if spacing not in SPACING_MODES:
+            raise ValueError(f"spacing must be one of {SPACING_MODES}")
+        self.spacing = spacing
+        # Euler-Maruyama runs inline below, the other schemes in integrators.py
+        self.integrator = integrator
+        # Error tolerance of the adaptive integrator (m/s and m per substep)
+        self.tolerance = tolerance
         self.sigma = sigma
+        if streams not in STREAMS:
+            raise ValueError(f"streams must be one of {STREAMS}")
+        # Counter-based draws are a function of the seed alone: fix a missing one so the run can be recreated
+        if streams == "counter" and seed is None:
+            seed = int(np.random.SeedSequence().entropy)
+        self.streams = streams
         self.seed = seed
         self.rng = np.random.default_rng(seed)
+        self.writer = None
+        # Set to a profiling.PhaseProfiler to time the phases of each step
+        self.profiler = None
+        # Online statistics updated after every step (see observables.py)
+        self.observables = []
         self.reset()
 
+    @property
+    def model(self):
+        return self._model.name
+
+    @model.setter
+    def model(self, model):
+        # Resolved once here, not on every step
+        self._model = get_model(model)
+        self._update_groups()
+
+    @property
+    def fast_math(self):
+        return self._fast_math
+
+    @fast_math.setter
+    def fast_math(self, fast_math):
+        self._fast_math = fast_math
+        self._update_groups()
+
+    @property
+    def integrator(self):
+        return self._integrator
+
+    @integrator.setter
+    def integrator(self, integrator):
+        if integrator not in INTEGRATORS:
+            raise ValueError(f"integrator must be one of {INTEGRATORS}")
+        self._integrator = integrator
+
+    @property
+    def vehicle_models(self):
+        return self._vehicle_models
+
+    @vehicle_models.setter
+    def vehicle_models(self, vehicle_models):
+        self._vehicle_models = None if vehicle_models is None else list(vehicle_models)
+        self._update_groups()
+
+    def _update_groups(self):
+        if self._vehicle_models is None:
+            self._groups = [(self._model, slice(None))]
+        else:
+            self._groups = index_groups([self._model if m is None else m for m in self._vehicle_models])
+        self._volatility = volatility
+        if self._fast_math:
+            self._groups = [(fastmath.fast_model(model), indices) for model, indices in self._groups]
+            self._volatility = fastmath.volatility
+
     def reset(self):
+        n = self.n
         # Evenly spaced initial positions, all same speed
-        self.x = np.linspace(0, self.L, self.n, endpoint=False)
-        self.speed = np.full(self.n, 5.0)  # initial speed (m/s) matching NetLogo
-        self.acc = np.zeros(self.n)
-        self.gap = np.zeros(self.n)
+        self.x = np.linspace(0, self.L, n, endpoint=False)
+        self.speed = np.full(n, 5.0)  # initial speed (m/s) matching NetLogo
+        self.acc = np.zeros(n)
+        self.gap = np.zeros(n)
         self.time = 0.0
+        self.tick = 0
+        # Substep level of the adaptive integrator (dt / 2**level), and substeps in the last step
+        self._level = 0
+        self.substeps = 1
+        # Counter-based noise keyed by (seed, tick, vehicle); draws made so far in the current tick
+        self._counter = CounterNoise([self.seed], n) if self.streams == "counter" else None
+        self._draw_tick = -1
+        self._draws = 0
+        # Work buffers reused by every step; x and speed swap with the "new" ones
+        self._new_x = np.empty(n)
+        self._new_speed = np.empty(n)
+        self._rel_speed = np.empty(n)
+        self._noise = np.empty(n)
+        self._dW = np.empty(n)
+        self._valid = np.empty(n, dtype=bool)
         # Clear all history
-        self.history = {"x": [], "speed": [], "gap": [], "mean_speed": [], "gap_sd": [], "time": []}
+        self.history = History((n,), capacity=self.history_capacity)
         # Add initial state to history
-        self.history["x"].append(self.x.copy())
-        self.history["speed"].append(self.speed.copy())
-        self.history["gap"].append(self.gap.copy())
-        self.history["mean_speed"].append(np.mean(self.speed))
-        self.history["gap_sd"].append(np.std(self.gap))
-        self.history["time"].append(self.time)
-
-    def apply_perturbation(self):
-        """Apply a braking perturbation to the blue vehicle (index 21)"""
-        # Reduce speed of blue vehicle by 50%
-        self.speed[21] *= 0.2
+        self.record()
+
+    def config(self):
+        """Constructor arguments that recreate this simulation (models by name)"""
+        vehicle_models = None
+        if self._vehicle_models is not None:
+            vehicle_models = [getattr(m, "name", m) for m in self._vehicle_models]
+        return {"n_vehicles": self.n, "circuit_length": self.L, "dt": self.dt, "model": self.model,
+                "sigma": self.sigma, "seed": self.seed, "history_capacity": self.history_capacity,
+                "vehicle_models": vehicle_models, "spacing": self.spacing, "integrator": self.integrator,
+                "tolerance": self.tolerance, "fast_math": self.fast_math, "streams": self.streams}
+
+    def get_state(self):
+        """Full state: configuration, vehicle arrays, clock and the exact RNG state.
+
+        VehicleSimulation.from_state(state) continues bit for bit where this
+        run is now. History, stream, profiler and observables are not included.
+        """
+        return {"config": self.config(), "x": self.x.copy(), "speed": self.speed.copy(),
+                "acc": self.acc.copy(), "gap": self.gap.copy(), "time": self.time, "tick": self.tick,
+                "rng": self.rng.bit_generator.state, "level": self._level}
+
+    def set_state(self, state):
+        """Continue from a get_state() dict of a run with the same number of vehicles"""
+        if len(state["x"]) != self.n:
+            raise ValueError("state has a different number of vehicles")
+        self.x = np.array(state["x"], dtype=float)
+        self.speed = np.array(state["speed"], dtype=float)
+        self.acc = np.array(state["acc"], dtype=float)
+        self.gap = np.array(state["gap"], dtype=float)
+        self.time = state["time"]
+        self.tick = state["tick"]
+        self.rng.bit_generator.state = state["rng"]
+        self._level = state.get("level", 0)
+        self._draw_tick = -1
+        # The history restarts at the restored state
+        self.history = History((self.n,), capacity=self.history_capacity)
+        self.record()
+
+    @classmethod
+    def from_state(cls, state):
+        """New simulation from get_state(); custom models must be registered under their names"""
+        sim = cls(**state["config"])
+        sim.set_state(state)
+        return sim
+
+    def warm_up(self, steps, cache=None):
+        """Skip the first `steps` steps using a warmcache.WarmStartCache (default location if None).
+
+        Only valid before the first step; returns True when the state came from the cache.
+        """
+        from warmcache import WarmStartCache
+        return (cache or WarmStartCache()).warm_up(self, steps)
+
+    def fork(self, count, seed=None):
+        """`count` copies of the current state, each with its own independent noise stream.
+
+        Child k is seeded with [seed, tick, k] (seed defaults to this run's),
+        so the same fork of the same checkpoint is reproducible and forks
+        taken at different ticks do not share streams.
+        """
+        base = self.seed if seed is None else seed
+        if base is None:
+            base = int(np.random.SeedSequence().entropy)
+        base = list(np.atleast_1d(base).tolist())
+        state = self.get_state()
+        children = []
+        for k in range(count):
+            child_seed = base + [self.tick, k]
+            state["config"]["seed"] = child_seed
+            child = VehicleSimulation.from_state(state)
+            child.rng = np.random.default_rng(child_seed)
+            children.append(child)
+        return children
+
+    def record(self):
+        """Append the current state to the history (and the stream, if any)"""
+        mean_speed = np.mean(self.speed)
+        gap_sd = np.std(self.gap)
+        self.history.append(self.x, self.speed, self.gap, mean_speed, gap_sd, self.time)
+        if self.writer is not None:
+            self.writer.append(self.x, self.speed, self.gap, mean_speed, gap_sd, self.time)
+
+    def stream_to(self, path, chunk_steps=1024):
+        """Also write every recorded step to a recording directory (see recording.py)
+
+        Combine with a small history_capacity to run for hours in bounded memory.
+        The current state is written as the first step.
+        """
+        self.close_stream()
+        metadata = {"model": self.model, "sigma": self.sigma, "seed": self.seed, "dt": self.dt, "L": self.L}
+        self.writer = TrajectoryWriter(path, self.n, metadata, chunk_steps=chunk_steps)
+        self.writer.append(self.x, self.speed, self.gap, np.mean(self.speed), np.std(self.gap), self.time)
+        return self.writer
+
+    def close_stream(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+    def apply_perturbation(self, vehicle=None, factor=0.2):
+        """Apply a braking perturbation (default: the blue vehicle, i.e. the last one)"""
+        if vehicle is None:
+            vehicle = self.n - 1
+        # Reduce speed of the vehicle to `factor` of its current value
+        self.speed[vehicle] *= factor
 
     def step(self):
-        n = self.n
+        self._advance()
+        self.record()
+        if self.profiler is not None:
+            self.profiler.mark("history")
+        self._observe()
+
+    def run(self, n_steps, perturbations=(), record_every=1, stop=()):
+        """Advance up to n_steps steps in one call.
+
+        perturbations is a schedule of Perturbation objects; those due within
+        this run are applied right before their tick. The state is recorded
+        every `record_every` ticks (0 records nothing). stop is a list of
+        stopping rules (see stopping.py), checked after every step.
+
+        Returns {"reason", "time", "tick", "steps"}: the name of the rule that
+        ended the run, or "steps" if it ran for all n_steps.
+        """
+        start = self.tick
+        end = start + n_steps
+        schedule = sorted(((p.due_tick(self), k, p) for k, p in enumerate(perturbations)), key=lambda d: d[:2])
+        schedule = [(tick, p) for tick, _, p in schedule if self.tick <= tick < end]
+        k = 0
+        for _ in range(n_steps):
+            while k < len(schedule) and schedule[k][0] == self.tick:
+                schedule[k][1].apply(self)
+                k += 1
+            self._advance()
+            if record_every and self.tick % record_every == 0:
+                self.record()
+                if self.profiler is not None:
+                    self.profiler.mark("history")
+            self._observe()
+            if stop:
+                reason = check_rules(stop, self)
+                if reason is not None:
+                    return self._stop_report(reason.item(), self.tick - start)
+        return self._stop_report(NO_STOP, n_steps)
+
+    def _stop_report(self, reason, steps):
+        return {"reason": reason, "time": self.time, "tick": self.tick, "steps": steps}
+
+    def _observe(self):
+        if not self.observables:
+            return
+        for observable in self.observables:
+            observable.update(self)
+        if self.profiler is not None:
+            self.profiler.mark("observables")
+
+    def _normal(self):
+        """Standard normal draws, one per vehicle"""
+        if self._counter is None:
+            return self.rng.standard_normal(self.n)
+        # Further draws within a tick (adaptive substeps) come from further lanes
+        if self._draw_tick != self.tick:
+            self._draw_tick = self.tick
+            self._draws = 0
+        lane = self._draws
+        self._draws += 1
+        return self._counter.draw(self.tick, lane)[0]
+
+    def _advance(self):
+        """One Euler-Maruyama step, computed in the preallocated buffers"""
+        if self._integrator != "euler":
+            return self._advance_scheme()
         L = self.L
         dt = self.dt
-        sigma = self.sigma
-        model = self.model
         x = self.x
         speed = self.speed
-        
-        # Initialize arrays
-        gap = np.zeros(n)
-        acc = np.zeros(n)
-        noise_volatility = np.zeros(n)
-        
-        # Compute gaps and relative speeds with proper periodic boundary handling
-        for i in range(n):
-            next_i = (i + 1) % n
-            # Calculate gap with proper periodic boundary handling
-            raw_gap = x[next_i] - x[i]
-            if raw_gap < 0:
-                raw_gap += L
-            # Calculate gap exactly as in NetLogo: gap = next_x - x - 5 + floor(who/21) * world-width
-                   # Subtract vehicle length and ensure minimum gap
-            gap[i] = max(raw_gap - 5, 0.1)  # 5m vehicle length, 0.1m minimum gap
-
-        
-        rel_speed = np.roll(speed, -1) - speed
-        
-        # Model selection
-        for i in range(n):
-            g = gap[i]
-            v = speed[i]
-            dv = rel_speed[i]
-            
-            if model == "SOVM":
-                acc[i] = (self.V(g) - v) / 0.5
-                # Calculate noise volatility for this vehicle
-                noise_volatility[i] = sigma / (1 + np.exp(min(700, -1000 * (v - 0.1))))
-            elif model == "SOVM unstable":
-                acc[i] = (self.V(g) - v) / 1.0
-                # Calculate noise volatility for this vehicle
-                noise_volatility[i] = sigma / (1 + np.exp(min(700, -1000 * (v - 0.1))))
-            elif model == "SFVDM":
-                acc[i] = (self.V(g) - v) / 2.5 + dv / 2.0
-                # Calculate noise volatility for this vehicle
-                noise_volatility[i] = sigma / (1 + np.exp(min(700, -1000 * (v - 0.1))))
-            elif model == "SFVDM unstable":
-                acc[i] = (self.V(g) - v) / 2.5 + dv / 2.7
-                # Calculate noise volatility for this vehicle
-                noise_volatility[i] = sigma / (1 + np.exp(min(700, -1000 * (v - 0.1))))
-            elif model == "Tomer et al.":
-                acc[i] = 7 * (1 - (v * 2 + 5) / (g + 5)) - (Z(-dv)) ** 2 / 2 / g - 2 * Z(v - 20)
-                # Calculate noise volatility for this vehicle
-                noise_volatility[i] = sigma / (1 + np.exp(min(700, -1000 * (v - 0.1)))) 
-            elif model == "Tomer et al. unstable":
-                acc[i] = 3 * (1 - (v * 2 + 5) / (g + 5)) - (Z(-dv)) ** 2 / 2 / g - 2 * Z(v - 20)
-                # Calculate noise volatility for this vehicle
-                noise_volatility[i] = sigma / (1 + np.exp(min(700, -1000 * (v - 0.1))))
-            elif model == "SIDM":
-                # f(v_n,Dv_n) = 2 + v_n - v_n * Dv_n / A, with A = 4
-                # v = GEschwidigkeit, 20= v0= Wunschgeschwindigkeit, g=gap=Nettoabstand
-                f = 2 + v - v * dv / 4
-                acc[i] = 2 * (1 - (f / g) ** 2 - (v / 20) ** 4)
-                # Calculate noise volatility for this vehicle
-                noise_volatility[i] = sigma / (1 + np.exp(min(700, -1000 * (v - 0.1))))
-            elif model == "SIDM unstable":
-                # f(v_n,Dv_n) = 2 + v_n - v_n * Dv_n / A, with A = 5
-                f = 2 + 1 * v - v * dv / 5
-                acc[i] = 2 * (1 - (f / g) ** 2 - (v / 20) ** 4)
-                # Calculate noise volatility for this vehicle
-                noise_volatility[i] = sigma / (1 + np.exp(min(700, -1000 * (v - 0.1))))
-            elif model == "SATG":
-                # Calculate time gap exactly as in NetLogo
-                bounded_time_gap = logsumexp(logsumexp(g / logsumexp(v, 1e-10, 0.01), 4, -0.01), 0.1, 0.01)
-                
-                # Calculate acceleration exactly as in NetLogo
-                acc[i] = (0.2 * (g - v) + dv) / bounded_time_gap
-                
-                # Calculate noise volatility for this vehicle
-                noise_volatility[i] = sigma / (1 + np.exp(min(700, -1000 * (v - 0.1))))
-        
-        # Update speeds with noise using Euler-Maruyama scheme
+        new_x = self._new_x
+        new_speed = self._new_speed
+        prof = self.profiler
+        if prof is not None:
+            prof.start()
+
+        # Gaps and relative speeds with periodic boundary handling
+        gap = compute_gaps(x, L, out=self.gap)
+        rel_speed = ring_difference(speed, out=self._rel_speed)
+        if prof is not None:
+            prof.mark("gaps")
+
+        # Model acceleration and noise volatility for all vehicles at once
+        acc = grouped_acceleration(self._groups, gap, speed, rel_speed)
+        if prof is not None:
+            prof.mark("acceleration")
+        noise = self._volatility(speed, self.sigma, out=self._noise)
+
         # Generate Wiener process increments dW_n
-        dW = self.rng.normal(0, 1, n)
-        valid = np.abs(acc) < 1e5
-        
-        # Calculate new speeds using Euler-Maruyama discretization:
+        if self._counter is None:
+            dW = self.rng.standard_normal(out=self._dW)
+        else:
+            dW = self._normal()
+        if prof is not None:
+            prof.mark("noise")
+        # new_x is free until the positions are updated: use it as scratch
+        invalid = np.logical_not(np.less(np.abs(acc, out=new_x), 1e5, out=self._valid), out=self._valid)
+
+        # Euler-Maruyama discretization:
         # v_n(t + dt) = v_n(t) + dt * acc + s(v_n) * sqrt(dt) * dW_n
-        new_speed = np.copy(speed)
-        new_speed[valid] = speed[valid] + dt * acc[valid] + np.sqrt(dt) * noise_volatility[valid] * dW[valid]
-        
+        np.multiply(acc, dt, out=new_speed)
+        new_speed += speed
+        noise *= np.sqrt(dt)
+        noise *= dW
+        new_speed += noise
+        np.copyto(new_speed, speed, where=invalid)
+
         # Ensure minimum speed to prevent complete stops
-        new_speed = np.maximum(new_speed, 0.1)
-        
+        np.maximum(new_speed, MIN_SPEED, out=new_speed)
+
         # Calculate new positions
-        new_x = x + new_speed * dt
-        
+        np.multiply(new_speed, dt, out=new_x)
+        new_x += x
+        if prof is not None:
+            prof.mark("integration")
+
         # Enforce minimum spacing between vehicles
-        for i in range(n):
-            next_i = (i + 1) % n
-            # Calculate actual distance between vehicles
-            dist = new_x[next_i] - new_x[i]
-            if dist < 0:
-                dist += L
-            # If vehicles are too close, adjust their positions
-            if dist < 5:  # Minimum safe distance (vehicle length)
-                # Move the following vehicle back
-                new_x[next_i] = new_x[i] + 5
-                # Ensure periodic boundary
-                if new_x[next_i] >= L:
-                    new_x[next_i] -= L
-        
+        if self.spacing == "ordered":
+            enforce_spacing_ordered(new_x, L)
+        else:
+            enforce_spacing_projection(new_x, L)
+
         # Apply periodic boundary conditions
-        new_x = new_x % L
-        
-        # Update state
-        self.x = new_x
-        self.speed = new_speed
+        np.remainder(new_x, L, out=new_x)
+
+        # Update state; the old arrays become next step's buffers
+        self.x, self._new_x = new_x, x
+        self.speed, self._new_speed = new_speed, speed
         self.acc = acc
-        self.gap = gap
         self.time += dt
-        self.history["x"].append(new_x.copy())
-        self.history["speed"].append(new_speed.copy())
-        self.history["gap"].append(gap.copy())
-        self.history["mean_speed"].append(np.mean(new_speed))
-        self.history["gap_sd"].append(np.std(gap))
-        self.history["time"].append(self.time)
+        self.tick += 1
+        if prof is not None:
+            prof.mark("spacing")
+
+    def _advance_scheme(self):
+        from integrators import advance
+        prof = self.profiler
+        if prof is not None:
+            prof.start()
+        self.x, self.speed, self.acc, self.gap = advance(self)
+        self.time += self.dt
+        self.tick += 1
+        if prof is not None:
+            prof.mark("integration")
 
     @staticmethod
     def V(s):
-        return 13.7 * tanh(s / 20 - 0.5) + 6.3
+        return optimal_velocity(s)
@@ -0,0 +1,155 @@
+"""Streaming spectra of the gap and speed fields around the ring.
+
+WaveSpectrum is an observable (see observables.py): every ``every`` steps it
+Fourier transforms each field over the vehicle index (the ring is periodic
+in the index, so no window is needed) and updates, per mode m:
+
+- the mean power |F_m|**2, whose largest m > 0 gives the wave number, the
+  wavelength L / m in metres and n / m in vehicles
+- the mean lag cross-spectrum F_m(t) conj(F_m(t - lag)), the Fourier
+  transform of the space-time cross-correlation at one sampling lag.
+  A pattern moving by c vehicles per second turns its phase by
+  -2 pi m c lag / n, which gives the wave speed in the index frame
+  (vehicles per second, positive downstream) and, with the mean spacing
+  L / n and the mean speed, in the lab frame (m/s; jams move upstream,
+  so negative)
+
+Memory is fixed: a few arrays of n // 2 + 1 values per field (and
+replica). The phase must turn by less than half a turn between samples,
+i.e. |c| * every * dt < n / (2 m); stop-and-go waves are far slower.
+
+    sim.observables.append(WaveSpectrum(every=10, warmup=100.0))
+    sim.run(6000, record_every=0)
+    sim.observables[-1].result()["gap"]["wave_speed"]
+"""
+import numpy as np
+from observables import Observable, _select, _value
+
+FIELDS = ("gap", "speed")
+
+
+class WaveSpectrum(Observable):
+    """Running power spectrum and lag cross-spectrum of vehicle fields over the vehicle index.
+
+    memory=None averages all samples since warmup; a number of seconds
+    averages exponentially over about that long instead, so that a live
+    display follows changes of the wave pattern.
+    """
+
+    name = "spectrum"
+
+    def __init__(self, fields=FIELDS, every=10, memory=None, warmup=0.0):
+        self.fields = tuple(fields)
+        self.every = every
+        self.memory = memory
+        super().__init__(warmup)
+
+    def reset(self):
+        self.count = 0
+        self._calls = 0
+        self._time = None
+        # Time between samples (s), ring size and length of the last sample
+        self.lag = None
+        self.n = None
+        self.L = None
+        self.mean_speed = None
+        self.power = {}
+        self.cross = {}
+        self._previous = {}
+
+    def _weight(self, count):
+        if self.memory is None or self.lag is None:
+            return 1.0 / count
+        return max(1.0 / count, 1.0 - np.exp(-self.lag / self.memory))
+
+    def observe(self, sim):
+        self._calls += 1
+        if (self._calls - 1) % self.every:
+            return
+        if self._time is not None:
+            self.lag = sim.time - self._time
+        self._time = sim.time
+        self.n = sim.n
+        self.L = sim.L
+        self.count += 1
+        weight = self._weight(self.count)
+        speed = np.mean(sim.speed, axis=-1)
+        self.mean_speed = speed if self.mean_speed is None else self.mean_speed + weight * (speed - self.mean_speed)
+        for field in self.fields:
+            coefficients = np.fft.rfft(getattr(sim, field), axis=-1) / sim.n
+            power = coefficients.real ** 2 + coefficients.imag ** 2
+            if field in self.power:
+                self.power[field] += weight * (power - self.power[field])
+            else:
+                self.power[field] = power
+            previous = self._previous.get(field)
+            if previous is not None:
+                cross = coefficients * previous.conj()
+                if field in self.cross:
+                    self.cross[field] += self._weight(self.count - 1) * (cross - self.cross[field])
+                else:
+                    self.cross[field] = cross
+            self._previous[field] = coefficients
+
+    def select(self, replicas):
+        self.mean_speed = _select(self.mean_speed, replicas)
+        for values in (self.power, self.cross, self._previous):
+            for field in values:
+                values[field] = values[field][replicas]
+
+    def correlation(self, field="gap"):
+        """Space-time cross-correlation of the field at time lag `lag`, over index shifts 0 .. n - 1.
+
+        Normalised by the equal-time variance; the shift of its maximum is
+        how far (in vehicles) the pattern moved during one lag.
+        """
+        cross = self.cross[field].copy()
+        cross[..., 0] = 0
+        power = self.power[field].copy()
+        power[..., 0] = 0
+        # Equal-time variance: twice the one-sided power, minus the Nyquist term counted once
+        variance = 2 * np.sum(power, axis=-1) - (power[..., -1] if self.n % 2 == 0 else 0)
+        # irfft(c)[s] = sum_m c_m e^{2 pi i m s / n} / n: the correlation of f(j + s, t) with f(j, t - lag)
+        return np.fft.irfft(cross, n=self.n, axis=-1) * self.n / variance[..., None]
+
+    def dominant(self, field="gap"):
+        """Wave number, wavelengths and wave speeds of the strongest mode m > 0"""
+        power = self.power[field]
+        mode = np.argmax(power[..., 1:], axis=-1) + 1
+        share = np.take_along_axis(power, mode[..., None], axis=-1)[..., 0] / np.sum(power[..., 1:], axis=-1)
+        result = {"wavenumber": mode, "wavelength": self.L / mode, "wavelength_vehicles": self.n / mode,
+                  "power_share": share, "index_speed": None, "wave_speed": None}
+        if field in self.cross and self.lag:
+            cross = np.take_along_axis(self.cross[field], mode[..., None], axis=-1)[..., 0]
+            # f(j - c t) has coefficients turning as exp(-2 pi i m c t / n)
+            index_speed = -np.angle(cross) * self.n / (2 * np.pi * mode * self.lag)
+            result["index_speed"] = index_speed
+            result["wave_speed"] = index_speed * self.L / self.n + self.mean_speed
+        return result
+
+    def result(self):
+        if self.count == 0:
+            return {"samples": 0}
+        result = {field: {key: _value(value) for key, value in self.dominant(field).items()}
+                  for field in self.fields}
+        result["samples"] = self.count
+        return result
+
+
+def format_spectrum(spectrum, modes=8, width=24):
+    """Text summary of a single-ring WaveSpectrum with a bar chart of the first modes"""
+    if spectrum.count == 0:
+        return "Spectrum: waiting for samples"
+    lines = []
+    for field in spectrum.fields:
+        d = spectrum.dominant(field)
+        line = (f"{field}: m={int(d['wavenumber'])}, wavelength {float(d['wavelength']):.0f} m"
+                f" ({float(d['wavelength_vehicles']):.1f} veh)")
+        if d["wave_speed"] is not None:
+            line += f", {float(d['index_speed']):+.2f} veh/s, {float(d['wave_speed']):+.2f} m/s"
+        lines.append(line)
+        power = spectrum.power[field][1:modes + 1]
+        top = power.max() if power.size and power.max() > 0 else 1.0
+        for m, p in enumerate(power, start=1):
+            lines.append(f"  m={m:<3d}{'#' * int(round(width * p / top))}")
+    return "\n".join(lines)
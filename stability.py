@@ -0,0 +1,193 @@
+"""Linear string stability of the uniform flow on the ring, without simulating.
+
+For a model f(g, v, dv) on a ring of n vehicles and length L, the uniform
+flow has every net gap at g* = L / n - VEHICLE_LENGTH and every speed at the
+v* solving f(g*, v*, 0) = 0 (found by bisection). Small perturbations y_j of
+the positions then follow
+
+    y_j'' = f_s (y_{j+1} - y_j) + f_v y_j' + f_dv (y_{j+1}' - y_j')
+
+with the partial derivatives of f at (g*, v*, 0), taken numerically, so any
+registered model works. The Fourier mode y_j ~ exp(i k j + lambda t),
+k = 2 pi m / n, grows with the roots of
+
+    lambda**2 - lambda (f_v + f_dv (e^{ik} - 1)) - f_s (e^{ik} - 1) = 0
+
+The uniform flow is linearly unstable when some mode m = 1 .. n - 1 has
+Re(lambda) > 0; that mode's wavelength L / m is where stop-and-go waves
+start. Everything is vectorised: n, L and model parameters may be arrays
+(broadcast together), so whole sweep grids take milliseconds:
+
+    r = analyze("SOVM", circuit_length=np.linspace(100, 400, 301), tau=np.linspace(0.2, 2, 91)[:, None])
+    r["stable"]          # (91, 301) booleans
+
+Noise does not enter: this is the deterministic part of each model, which
+is what tells the "stable" and "unstable" variants apart.
+"""
+import argparse
+
+import numpy as np
+from models import get_model, model_names
+from simulation import VEHICLE_LENGTH, MIN_GAP, MIN_SPEED
+
+# Largest growth rate (1/s) still counted as stable; absorbs the error of the numerical derivatives
+TOLERANCE = 1e-7
+BISECTION_STEPS = 60
+
+
+def _accel(model, params):
+    params = {**model.params, **params}
+    return lambda g, v, dv: model.accel(g, v, dv, **params)
+
+
+def equilibrium_speed(model, gap, **params):
+    """Speed v with f(gap, v, 0) = 0, elementwise; 0 where the model brakes even at rest"""
+    f = _accel(get_model(model), params)
+    gap = np.asarray(gap, dtype=float)
+    zero = np.zeros_like(gap)
+    lo = zero.copy()
+    hi = np.full_like(gap, 50.0)
+    # Widen the bracket where the model still accelerates at hi
+    for _ in range(20):
+        low = f(gap, hi, zero) > 0
+        if not low.any():
+            break
+        hi = np.where(low, 2 * hi, hi)
+    for _ in range(BISECTION_STEPS):
+        mid = 0.5 * (lo + hi)
+        faster = f(gap, mid, zero) > 0
+        lo = np.where(faster, mid, lo)
+        hi = np.where(faster, hi, mid)
+    return np.where(f(gap, zero, zero) > 0, 0.5 * (lo + hi), 0.0)
+
+
+def derivatives(model, gap, speed, **params):
+    """Central differences (f_s, f_v, f_dv) of the acceleration at (gap, speed, dv = 0)"""
+    f = _accel(get_model(model), params)
+    zero = np.zeros_like(speed)
+    h_s = 1e-6 * np.maximum(1.0, np.abs(gap))
+    h_v = 1e-6 * np.maximum(1.0, np.abs(speed))
+    f_s = (f(gap + h_s, speed, zero) - f(gap - h_s, speed, zero)) / (2 * h_s)
+    f_v = (f(gap, speed + h_v, zero) - f(gap, speed - h_v, zero)) / (2 * h_v)
+    f_dv = (f(gap, speed, zero + h_v) - f(gap, speed, zero - h_v)) / (2 * h_v)
+    return f_s, f_v, f_dv
+
+
+def mode_growth(f_s, f_v, f_dv, n_vehicles):
+    """Largest Re(lambda) of modes m = 1 .. n // 2 (m and n - m grow alike), along a new last axis.
+
+    Entries with m beyond n // 2 are -inf.
+    """
+    n = np.asarray(n_vehicles)
+    m = np.arange(1, int(np.max(n)) // 2 + 1)
+    n = n[..., None]
+    z = np.exp(2j * np.pi * m / n) - 1
+    b = f_v[..., None] + f_dv[..., None] * z
+    root = np.sqrt(b * b + 4 * f_s[..., None] * z)
+    growth = 0.5 * (b.real + np.abs(root.real))
+    return np.where(m <= n // 2, growth, -np.inf)
+
+
+def analyze(model, n_vehicles=22, circuit_length=231.0, **params):
+    """Equilibrium and linear stability of the uniform flow, for arrays of n, L and model parameters.
+
+    Returns a dict of arrays with the broadcast shape of the inputs:
+    gap, speed (equilibrium), f_s, f_v, f_dv, growth (largest Re(lambda),
+    1/s), mode (the most unstable m, 0 if stable), wavelength (L / mode, m),
+    stable (growth <= TOLERANCE), string_stable (the long-wave criterion
+    f_v**2 / 2 - f_dv f_v - f_s >= 0 of an infinite road) and jammed
+    (equilibrium speed below MIN_SPEED, where the simulation clamps speeds).
+    """
+    model = get_model(model)
+    shape = np.broadcast_shapes(np.shape(n_vehicles), np.shape(circuit_length), *map(np.shape, params.values()))
+    n = np.broadcast_to(np.asarray(n_vehicles, dtype=int), shape)
+    L = np.broadcast_to(np.asarray(circuit_length, dtype=float), shape)
+    gap = np.maximum(L / n - VEHICLE_LENGTH, MIN_GAP)
+    speed = equilibrium_speed(model, gap, **params)
+    f_s, f_v, f_dv = derivatives(model, gap, speed, **params)
+    growth = mode_growth(f_s, f_v, f_dv, n)
+    worst = np.argmax(growth, axis=-1)
+    rate = np.take_along_axis(growth, worst[..., None], axis=-1)[..., 0]
+    stable = rate <= TOLERANCE
+    mode = np.where(stable, 0, worst + 1)
+    return {
+        "gap": gap,
+        "speed": speed,
+        "f_s": f_s,
+        "f_v": f_v,
+        "f_dv": f_dv,
+        "growth": rate,
+        "mode": mode,
+        "wavelength": np.where(stable, np.inf, L / np.maximum(mode, 1)),
+        "stable": stable,
+        "string_stable": f_v ** 2 / 2 - f_dv * f_v - f_s >= -TOLERANCE,
+        "jammed": speed < MIN_SPEED,
+    }
+
+
+def growth_time(model, n_vehicles=22, circuit_length=231.0, **params):
+    """1 / growth rate of the most unstable mode (s), 0 where the uniform flow is stable"""
+    r = analyze(model, n_vehicles, circuit_length, **params)
+    with np.errstate(divide="ignore"):
+        return np.where(r["stable"], 0.0, 1.0 / r["growth"])
+
+
+def classify_cells(cells):
+    """Linear stability (True = stable) of sweep cells, one analyze() call per model"""
+    stable = np.empty(len(cells), dtype=bool)
+    by_model = {}
+    for i, cell in enumerate(cells):
+        by_model.setdefault(cell["model"], []).append(i)
+    for model, rows in by_model.items():
+        n = np.array([cells[i]["n_vehicles"] for i in rows])
+        L = np.array([cells[i]["circuit_length"] for i in rows])
+        stable[rows] = analyze(model, n, L)["stable"]
+    return stable
+
+
+def unstable_ranges(stable, values):
+    """[(first, last), ...] runs of values where stable is False (1-d)"""
+    ranges = []
+    start = None
+    for value, ok in zip(values, stable):
+        if not ok and start is None:
+            start = value
+        if ok and start is not None:
+            ranges.append((start, last))
+            start = None
+        last = value
+    if start is not None:
+        ranges.append((start, last))
+    return ranges
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="main.py stability",
+                                     description="Linear stability of the uniform flow of every registered model")
+    parser.add_argument("--model", action="append", default=None, help="only this model (repeatable)")
+    parser.add_argument("-n", "--vehicles", type=int, default=22)
+    parser.add_argument("-L", "--length", type=float, default=231.0, help="circuit length [m]")
+    parser.add_argument("--lengths", type=float, nargs=3, default=None, metavar=("START", "STOP", "COUNT"),
+                        help="also list the unstable ranges of the circuit length over this grid")
+    args = parser.parse_args(argv)
+
+    names = args.model or model_names()
+    print(f"n={args.vehicles}, L={args.length:g} m, equilibrium gap {args.length / args.vehicles - VEHICLE_LENGTH:.2f} m")
+    print(f"{'model':<24}{'speed':>8}{'f_s':>9}{'f_v':>9}{'f_dv':>9}{'growth':>11}{'mode':>6}{'wavelength':>12}"
+          f"  stable  string")
+    for name in names:
+        r = analyze(name, args.vehicles, args.length)
+        print(f"{name:<24}{r['speed']:>8.3f}{r['f_s']:>9.4f}{r['f_v']:>9.4f}{r['f_dv']:>9.4f}{r['growth']:>11.2e}"
+              f"{r['mode']:>6d}{r['wavelength']:>12.1f}  {str(bool(r['stable'])):<6}  {bool(r['string_stable'])}")
+    if args.lengths:
+        start, stop, count = args.lengths
+        lengths = np.linspace(start, stop, int(count))
+        print(f"\nunstable circuit lengths for n={args.vehicles} [m]")
+        for name in names:
+            ranges = unstable_ranges(analyze(name, args.vehicles, lengths)["stable"], lengths)
+            text = ", ".join(f"{a:g}-{b:g}" for a, b in ranges) or "none"
+            print(f"{name:<24}{text}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""Stopping rules: end a run once its outcome is clear instead of after a fixed number of steps.
+
+A rule has ``update(sim)``, called once per step, which returns whether
+each ring may stop (a bool for a VehicleSimulation, one per replica for an
+EnsembleSimulation). Once a ring has stopped it stays stopped. Rules keep
+state between runs; call ``reset()`` before reusing one.
+
+    rules = default_rules(window=50.0, jam_duration=60.0)
+    report = sim.run(20000, stop=rules)
+    report["reason"], report["time"]     # e.g. "stationary", 212.5
+
+- ``StationaryRule``: mean speed and gap SD averaged over consecutive
+  windows of ``window`` seconds show no trend over several windows, once
+  linearly unstable rings have had time to grow their waves
+- ``JamRule``: some vehicle has been slower than ``jam_speed`` without
+  interruption for ``duration`` seconds (persistent stop-and-go)
+"""
+import numpy as np
+from observables import JAM_SPEED, mean_speed, gap_sd
+
+# Reason reported when no rule fired before the step budget ran out
+NO_STOP = "steps"
+# Default warmup of StationaryRule in linear growth times: perturbations grow by about e**4 ~ 55
+GROWTH_TIMES = 4.0
+
+
+def linear_warmup(sim):
+    """GROWTH_TIMES linear growth times of each ring's configuration (s); the slowest model of a mixed fleet"""
+    from stability import growth_time
+    if hasattr(sim, "models"):
+        models = [[model] for model in sim.models]
+    else:
+        models = [[sim._model] + [m for m in (sim.vehicle_models or []) if m is not None]]
+    times = [max(float(growth_time(model, sim.n, sim.L)) for model in ring) for ring in models]
+    return GROWTH_TIMES * (np.array(times) if hasattr(sim, "models") else times[0])
+
+
+class StoppingRule:
+    """Base class: per-ring stop flags, sticky once set"""
+
+    name = "rule"
+
+    def __init__(self, warmup=0.0):
+        self.warmup = warmup
+        self.reset()
+
+    def reset(self):
+        self.stopped = None
+
+    def update(self, sim):
+        if sim.time >= self.warmup:
+            stop = self.check(sim)
+            self.stopped = stop if self.stopped is None else self.stopped | stop
+        if self.stopped is None:
+            return np.zeros(np.shape(sim.speed)[:-1], dtype=bool)
+        return self.stopped
+
+    def check(self, sim):
+        raise NotImplementedError
+
+    def select(self, replicas):
+        """Keep the state of the given replicas only (see EnsembleSimulation.select)"""
+        if self.stopped is not None:
+            self.stopped = self.stopped[replicas]
+
+
+class StationaryRule(StoppingRule):
+    """Stop when the window means of mean speed and gap SD have stopped changing.
+
+    The run is cut into consecutive windows of ``window`` seconds. A ring
+    stops at the end of a window once the last ``windows + 1`` window means
+    show no trend: each of them, and in particular the first one of the
+    span, is within ``max(atol, tolerance * |mean|)`` of the last, for both
+    statistics. A slow drift that passes one pairwise comparison fails
+    over the span.
+
+    warmup=None waits GROWTH_TIMES times the linear growth time of the
+    ring's configuration (see stability.py; 0 for linearly stable ones),
+    so unstable rings are not stopped during their slow initial growth.
+    """
+
+    name = "stationary"
+
+    def __init__(self, window=50.0, tolerance=0.02, atol=0.05, windows=3, warmup=None):
+        self.window = window
+        self.tolerance = tolerance
+        self.atol = atol
+        self.windows = windows
+        super().__init__(warmup)
+
+    def reset(self):
+        super().reset()
+        self._sums = None
+        self._steps = 0
+        # Means of the last windows + 1 windows, oldest first: shape (windows + 1, 2, rings)
+        self._means = None
+        self._start = self.warmup
+
+    def update(self, sim):
+        if self._start is None:
+            self._start = linear_warmup(sim)
+        stop = self.check(sim) & (sim.time >= self._start)
+        self.stopped = stop if self.stopped is None else self.stopped | stop
+        return self.stopped
+
+    def check(self, sim):
+        if self._sums is None:
+            self._sums = np.zeros((2,) + np.shape(sim.speed)[:-1])
+        self._sums[0] += mean_speed(sim)
+        self._sums[1] += gap_sd(sim)
+        self._steps += 1
+        stop = np.zeros(self._sums.shape[1:], dtype=bool)
+        if self._steps < max(1, int(round(self.window / sim.dt))):
+            return stop
+        means = self._sums / self._steps
+        self._sums = None
+        self._steps = 0
+        if self._means is None:
+            self._means = means[None]
+        else:
+            self._means = np.concatenate([self._means, means[None]])[-(self.windows + 1):]
+        if len(self._means) <= self.windows:
+            return stop
+        limit = np.maximum(self.atol, self.tolerance * np.abs(means))
+        return np.all(np.abs(self._means - means) <= limit, axis=(0, 1))
+
+    def select(self, replicas):
+        super().select(replicas)
+        if self._sums is not None:
+            self._sums = self._sums[:, replicas]
+        if self._means is not None:
+            self._means = self._means[:, :, replicas]
+        if np.ndim(self._start):
+            self._start = self._start[replicas]
+
+
+class JamRule(StoppingRule):
+    """Stop when some vehicle has been slower than jam_speed for `duration` seconds in a row"""
+
+    name = "stop_and_go"
+
+    def __init__(self, duration=60.0, jam_speed=JAM_SPEED, warmup=0.0):
+        self.duration = duration
+        self.jam_speed = jam_speed
+        super().__init__(warmup)
+
+    def reset(self):
+        super().reset()
+        # Time the current jam was first seen, NaN while there is none
+        self.since = None
+
+    def check(self, sim):
+        jammed = np.min(sim.speed, axis=-1) < self.jam_speed
+        if self.since is None:
+            self.since = np.full(jammed.shape, np.nan)
+        self.since[~jammed] = np.nan
+        self.since[jammed & np.isnan(self.since)] = sim.time
+        return jammed & (sim.time - self.since >= self.duration - 1e-9)
+
+    def select(self, replicas):
+        super().select(replicas)
+        if self.since is not None:
+            self.since = self.since[replicas]
+
+
+def default_rules(window=50.0, tolerance=0.02, jam_duration=60.0, jam_speed=JAM_SPEED, warmup=None, atol=0.05,
+                  windows=3):
+    """A StationaryRule and a JamRule; window=None or jam_duration=None leaves one out.
+
+    warmup=None gives the StationaryRule its linear growth time default and
+    lets the JamRule act from the start; a number applies to both.
+    """
+    rules = []
+    if window is not None:
+        rules.append(StationaryRule(window, tolerance, atol, windows, warmup=warmup))
+    if jam_duration is not None:
+        rules.append(JamRule(jam_duration, jam_speed, warmup=0.0 if warmup is None else warmup))
+    return rules
+
+
+def check_rules(rules, sim):
+    """Update every rule; None while no ring stops, otherwise the name of the
+    first rule that stops each ring ("" where none does)"""
+    flags = [rule.update(sim) for rule in rules]
+    if not any(np.any(stopped) for stopped in flags):
+        return None
+    reason = np.full(np.shape(flags[0]), "", dtype=object)
+    for rule, stopped in zip(rules, flags):
+        reason[stopped & (reason == "")] = rule.name
+    return reason
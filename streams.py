@@ -0,0 +1,113 @@
+"""Counter-based noise streams: every draw is a function of (seed, step, vehicle).
+
+By default each run draws its Wiener increments from one sequential numpy
+generator, so a draw depends on everything drawn before it. With
+``streams="counter"`` (VehicleSimulation, EnsembleSimulation, the sweep
+spec and ``run --streams counter``) the standard normal of vehicle i at
+step t is instead computed from a hash of (seed, t, i):
+
+    z = SplitMix64(key(seed) + counter(t, i) * GAMMA)      two per draw
+    normal = sqrt(-2 log(1 - u0)) * cos(2 pi u1)           Box-Muller
+
+A replica is identified by its seed, as everywhere else here (ensemble
+seeds, forked seeds [seed, tick, k]). The same seed therefore gives the
+same trajectory whether it runs alone, at any position of any ensemble or
+sweep chunk, in any worker process, or continued from a checkpoint.
+
+Draws are generated in blocks of many steps for all replicas at once,
+which removes the per-step, per-replica generator calls of the sequential
+mode. A single value costs more than numpy's ziggurat, so the gain is
+largest for ensembles of short rings. Further draws within one step (the
+substeps and bridges of the adaptive integrator) use separate lanes of
+the same key.
+"""
+import numpy as np
+
+# SplitMix64 constants
+GAMMA = 0x9E3779B97F4A7C15
+MIX1 = 0xBF58476D1CE4E5B9
+MIX2 = 0x94D049BB133111EB
+# Offsets the key of lane k > 0 (further draws within a step)
+LANE = 0xD1B54A32D192ED03
+MASK = 2 ** 64 - 1
+# Values per generated block, and the most steps one block may cover
+BLOCK_VALUES = 2 ** 16
+MAX_BLOCK_STEPS = 1024
+
+
+def _mix(z):
+    # SplitMix64 finalizer on a uint64 array; multiplication wraps modulo 2**64
+    z = z ^ (z >> np.uint64(30))
+    z *= np.uint64(MIX1)
+    z ^= z >> np.uint64(27)
+    z *= np.uint64(MIX2)
+    z ^= z >> np.uint64(31)
+    return z
+
+
+def stream_key(seed, lane=0):
+    """64-bit key of a seed (int or list of ints, as for np.random.default_rng)"""
+    key = int(np.random.SeedSequence(seed).generate_state(1, np.uint64)[0])
+    if lane:
+        key = int(_mix(np.array([(key + lane * LANE) & MASK], dtype=np.uint64))[0])
+    return key
+
+
+def counter_normals(keys, start, steps, n):
+    """Standard normals of steps start .. start + steps - 1 and vehicles 0 .. n - 1.
+
+    One stream per key; the result has shape (steps, len(keys), n).
+    Vehicles 2j and 2j + 1 take the cosine and sine of one Box-Muller pair.
+    Vehicle indices must be below 2**32 and steps below 2**32.
+    """
+    keys = np.asarray(keys, dtype=np.uint64).reshape(1, -1, 1)
+    step = np.arange(start, start + steps, dtype=np.uint64).reshape(-1, 1, 1)
+    pair = np.arange((n + 1) // 2, dtype=np.uint64)
+    # Position of the first of the two uniforms of (step, pair) in the SplitMix sequence
+    position = (step << np.uint64(32)) | (pair << np.uint64(1))
+    position *= np.uint64(GAMMA)
+    z = keys + position
+    u0 = (_mix(z) >> np.uint64(11)) * 2.0 ** -53
+    z += np.uint64(GAMMA)
+    angle = (_mix(z) >> np.uint64(11)) * (2 * np.pi * 2.0 ** -53)
+    # 1 - u0 is in (0, 1]
+    radius = np.sqrt(-2 * np.log1p(-u0))
+    normals = np.empty(z.shape[:-1] + (2 * len(pair),))
+    np.multiply(radius, np.cos(angle), out=normals[..., 0::2])
+    np.multiply(radius, np.sin(angle), out=normals[..., 1::2])
+    return normals[..., :n]
+
+
+class CounterNoise:
+    """Counter-based normals for one stream per seed, generated in blocks of steps"""
+
+    def __init__(self, seeds, n, block_values=BLOCK_VALUES):
+        self.seeds = list(seeds)
+        self.keys = np.array([stream_key(seed) for seed in self.seeds], dtype=np.uint64)
+        self.n = n
+        self.block_steps = int(np.clip(block_values // max(1, len(self.seeds) * n), 1, MAX_BLOCK_STEPS))
+        self._start = 0
+        self._block = None
+        self._lane_keys = {}
+
+    def draw(self, step, lane=0):
+        """(len(seeds), n) normals of `step`; lanes > 0 are further independent draws of the same step"""
+        if lane:
+            keys = self._lane_keys.get(lane)
+            if keys is None:
+                keys = self._lane_keys[lane] = np.array([stream_key(seed, lane) for seed in self.seeds],
+                                                         dtype=np.uint64)
+            return counter_normals(keys, step, 1, self.n)[0]
+        block = self._block
+        if block is None or not self._start <= step < self._start + len(block):
+            self._start = step
+            self._block = block = counter_normals(self.keys, step, self.block_steps, self.n)
+        return block[step - self._start]
+
+    def select(self, index):
+        """Keep only the streams of the given seeds (indices), as EnsembleSimulation.select"""
+        self.seeds = [self.seeds[k] for k in index]
+        self.keys = self.keys[index]
+        self._lane_keys = {}
+        if self._block is not None:
+            self._block = self._block[:, index]
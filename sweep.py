@@ -0,0 +1,313 @@
+"""Headless parameter sweeps over (model, sigma, seed, n_vehicles, circuit_length).
+
+A grid spec is a dict whose entries are a single value or a list of values:
+
+    {"model": ["SOVM", "SATG"], "sigma": [0.0, 0.3, 0.6], "seed": list(range(20)),
+     "n_vehicles": 22, "circuit_length": 231.0, "dt": 0.05, "steps": 6000}
+
+Every combination is one cell. Cells that share n_vehicles, circuit_length,
+dt and steps are batched into chunks, each chunk runs as one
+EnsembleSimulation in a worker process, and one JSON line per cell is
+appended to the results file as soon as its chunk finishes. Re-running the
+same sweep on the same file skips the cells already recorded there.
+
+Runs can end early with stopping rules (see stopping.py): "stop_window"
+(seconds) stops a cell once its mean speed and gap SD have shown no trend
+beyond "stop_tolerance" (or "stop_atol") over "stop_windows" consecutive
+windows, checked from "stop_warmup" seconds on (default: four linear growth
+times of the configuration), "jam_duration" (seconds) once
+stop-and-go has persisted that long; "steps" is then the upper bound. Each
+record says why ("stop_reason") and when ("stop_time") its run stopped.
+
+Only numpy is needed; nothing here imports PyQt5 or matplotlib.
+"""
+import argparse
+import itertools
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+from ensemble import EnsembleSimulation
+from stopping import NO_STOP, check_rules, default_rules
+
+GRID_KEYS = ["model", "sigma", "seed", "n_vehicles", "circuit_length"]
+DEFAULTS = {
+    "model": "SATG",
+    "sigma": 0.6,
+    "seed": 0,
+    "n_vehicles": 22,
+    "circuit_length": 231.0,
+    "dt": 0.05,
+    "steps": 6000,
+    # Summary statistics are averaged over the last `average_fraction` of the run
+    "average_fraction": 0.25,
+    # A vehicle slower than this counts as jammed (m/s)
+    "jam_speed": 1.0,
+    # Stopping rules, off unless stop_window or jam_duration is set (seconds)
+    "stop_window": None,
+    "stop_tolerance": 0.02,
+    # Absolute tolerance of the window means, windows without a trend, and when
+    # to start checking (seconds; None: 4 linear growth times, see stopping.py)
+    "stop_atol": 0.05,
+    "stop_windows": 3,
+    "stop_warmup": None,
+    "jam_duration": None,
+    # Time integration scheme, see integrators.py
+    "integrator": "euler",
+    # Lookup-table model functions, see fastmath.py
+    "fast_math": False,
+    # "counter" makes every draw a function of (seed, step, vehicle), see streams.py
+    "streams": "sequential",
+}
+# Stopping settings (and the integrator, fast_math and streams, unless changed) only enter
+# the key of cells that use them, so that records written before they
+# existed still match on resume
+STOP_KEYS = ("stop_window", "stop_tolerance", "stop_atol", "stop_windows", "stop_warmup", "jam_duration")
+
+
+def expand_grid(spec):
+    """List of cell dicts, one per combination of the grid values"""
+    unknown = set(spec) - set(DEFAULTS)
+    if unknown:
+        raise ValueError(f"Unknown sweep parameters: {sorted(unknown)}")
+    spec = {**DEFAULTS, **spec}
+    axes = []
+    for key in DEFAULTS:
+        value = spec[key]
+        if key in GRID_KEYS and isinstance(value, (list, tuple, range, np.ndarray)):
+            axes.append([(key, v) for v in value])
+        else:
+            axes.append([(key, value)])
+    cells = []
+    for combo in itertools.product(*axes):
+        cell = dict(combo)
+        cell["n_vehicles"] = int(cell["n_vehicles"])
+        cell["seed"] = int(cell["seed"])
+        for key in ("sigma", "circuit_length", "dt", "average_fraction", "jam_speed") + STOP_KEYS:
+            if cell[key] is not None:
+                cell[key] = float(cell[key])
+        cell["steps"] = int(cell["steps"])
+        cell["stop_windows"] = int(cell["stop_windows"])
+        cell["fast_math"] = bool(cell["fast_math"])
+        cells.append(cell)
+    return cells
+
+
+def cell_key(cell):
+    """Stable identifier of a cell, used to skip finished work on resume"""
+    keys = [k for k in DEFAULTS if k not in STOP_KEYS or stops_early(cell)]
+    if cell["integrator"] == "euler":
+        keys.remove("integrator")
+    if not cell["fast_math"]:
+        keys.remove("fast_math")
+    if cell["streams"] == "sequential":
+        keys.remove("streams")
+    return json.dumps({k: cell[k] for k in keys}, sort_keys=True)
+
+
+def stops_early(cell):
+    return cell["stop_window"] is not None or cell["jam_duration"] is not None
+
+
+def make_chunks(cells, chunk_size):
+    """Split cells into chunks that can share one EnsembleSimulation"""
+    groups = {}
+    for cell in cells:
+        shape = (cell["n_vehicles"], cell["circuit_length"], cell["dt"], cell["steps"],
+                 cell["average_fraction"], cell["jam_speed"]) + tuple(cell[k] for k in STOP_KEYS)
+        shape += (cell["integrator"], cell["fast_math"], cell["streams"])
+        groups.setdefault(shape, []).append(cell)
+    chunks = []
+    for group in groups.values():
+        for start in range(0, len(group), chunk_size):
+            chunks.append(group[start:start + chunk_size])
+    return chunks
+
+
+def run_chunk(cells):
+    """Simulate one chunk of compatible cells and return their summaries.
+
+    Summary statistics are averaged over the last `average_fraction` of the
+    run, or with stopping rules over the last stop window (jam_duration
+    without one). Replicas that stop are summarised and dropped from the
+    ensemble right away, so the rest of the chunk runs on fewer rings.
+    """
+    first = cells[0]
+    ens = EnsembleSimulation(
+        seeds=[c["seed"] for c in cells],
+        n_vehicles=first["n_vehicles"],
+        circuit_length=first["circuit_length"],
+        dt=first["dt"],
+        model=[c["model"] for c in cells],
+        sigma=[c["sigma"] for c in cells],
+        record_history=False,
+        integrator=first["integrator"],
+        fast_math=first["fast_math"],
+        streams=first["streams"]
+    )
+    steps = first["steps"]
+    jam_speed = first["jam_speed"]
+    rules = []
+    if stops_early(first):
+        rules = default_rules(first["stop_window"], first["stop_tolerance"], first["jam_duration"], jam_speed,
+                              warmup=first["stop_warmup"], atol=first["stop_atol"], windows=first["stop_windows"])
+        seconds = first["stop_window"] if first["stop_window"] is not None else first["jam_duration"]
+        window = max(1, int(round(seconds / first["dt"])))
+    else:
+        window = max(1, int(round(steps * first["average_fraction"])))
+    window = min(window, steps)
+
+    # Mean speed, gap SD, jammed fraction and minimum speed of the last `window` steps, per replica
+    recent = np.empty((4, window, ens.R))
+    # Cell of each replica still running
+    active = np.arange(ens.R)
+    results = [None] * len(cells)
+    for t in range(steps):
+        ens.step()
+        if rules or t >= steps - window:
+            row = t % window
+            recent[0, row] = np.mean(ens.speed, axis=1)
+            recent[1, row] = np.std(ens.gap, axis=1)
+            recent[2, row] = np.mean(ens.speed < jam_speed, axis=1)
+            recent[3, row] = ens.speed.min(axis=1)
+        reason = check_rules(rules, ens) if rules else None
+        if t + 1 == steps:
+            if reason is None:
+                reason = np.full(ens.R, "", dtype=object)
+            reason[reason == ""] = NO_STOP
+        elif reason is None:
+            continue
+        done = reason != ""
+        if not done.any():
+            continue
+        filled = recent[:, :min(t + 1, window)]
+        for j in np.flatnonzero(done):
+            k = active[j]
+            results[k] = _summary(cells[k], ens, j, filled[:, :, j], reason[j], t + 1)
+        if done.all():
+            break
+        keep = ~done
+        active = active[keep]
+        recent = recent[:, :, keep]
+        ens.select(keep)
+        for rule in rules:
+            rule.select(keep)
+    return results
+
+
+def _summary(cell, ens, j, recent, reason, steps):
+    min_speed = float(recent[3].min())
+    return {
+        **cell,
+        "key": cell_key(cell),
+        "mean_speed": float(np.mean(ens.speed[j])),
+        "gap_sd": float(np.std(ens.gap[j])),
+        "mean_speed_avg": float(recent[0].mean()),
+        "gap_sd_avg": float(recent[1].mean()),
+        "min_speed": min_speed,
+        "jam_fraction": float(recent[2].mean()),
+        "stop_and_go": bool(min_speed < cell["jam_speed"]),
+        "stop_reason": reason,
+        "stop_time": ens.time,
+        "steps_run": steps,
+    }
+
+
+def load_results(path):
+    """Read all complete result records from a results file"""
+    results = []
+    if not os.path.exists(path):
+        return results
+    with open(path) as f:
+        for line in f:
+            if not line.endswith("\n"):
+                break  # partial line from an interrupted write
+            results.append(json.loads(line))
+    return results
+
+
+def _repair_tail(path):
+    # Drop a trailing partial record left behind by a crash
+    if not os.path.exists(path):
+        return
+    with open(path, "rb+") as f:
+        data = f.read()
+        end = data.rfind(b"\n") + 1
+        if end != len(data):
+            f.truncate(end)
+
+
+def run_sweep(spec, results_path, workers=None, chunk_size=None, resume=True, progress=True, linear=None):
+    """Run every cell of the grid that is not yet in results_path.
+
+    linear="stable" or "unstable" only runs the cells whose uniform flow the
+    linear analysis (stability.py) classifies so. Returns the number of
+    cells simulated by this call.
+    """
+    cells = expand_grid(spec)
+    if linear is not None:
+        from stability import classify_cells
+        keep = classify_cells(cells) == (linear == "stable")
+        cells = [c for c, k in zip(cells, keep) if k]
+    if resume:
+        _repair_tail(results_path)
+        done = {r["key"] for r in load_results(results_path)}
+        cells = [c for c in cells if cell_key(c) not in done]
+    elif os.path.exists(results_path):
+        os.remove(results_path)
+    if not cells:
+        return 0
+
+    workers = workers or os.cpu_count() or 1
+    if chunk_size is None:
+        # Several chunks per worker keep all cores busy until the end
+        chunk_size = max(1, min(64, -(-len(cells) // (4 * workers))))
+    chunks = make_chunks(cells, chunk_size)
+
+    with open(results_path, "a") as out:
+        if workers == 1:
+            completed = (run_chunk(chunk) for chunk in chunks)
+            _write_all(completed, out, len(cells), progress)
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = [pool.submit(run_chunk, chunk) for chunk in chunks]
+                completed = (future.result() for future in as_completed(futures))
+                _write_all(completed, out, len(cells), progress)
+    return len(cells)
+
+
+def _write_all(completed, out, total, progress):
+    written = 0
+    for results in completed:
+        for result in results:
+            out.write(json.dumps(result) + "\n")
+        # Make finished chunks durable before reporting them
+        out.flush()
+        os.fsync(out.fileno())
+        written += len(results)
+        if progress:
+            print(f"\r{written}/{total} runs", end="", flush=True)
+    if progress:
+        print()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a parameter sweep from a JSON grid spec")
+    parser.add_argument("spec", help="JSON file with the grid spec")
+    parser.add_argument("results", help="results file (JSON lines), appended to and resumed from")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--chunk-size", type=int, default=None, help="cells per chunk")
+    parser.add_argument("--restart", action="store_true", help="discard existing results instead of resuming")
+    parser.add_argument("--linear", choices=("stable", "unstable"), default=None,
+                        help="only run the cells that the linear stability analysis classifies so (stability.py)")
+    args = parser.parse_args(argv)
+
+    with open(args.spec) as f:
+        spec = json.load(f)
+    run_sweep(spec, args.results, workers=args.workers, chunk_size=args.chunk_size, resume=not args.restart,
+              linear=args.linear)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,7 @@
 import sys
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout,
                            QHBoxLayout, QLabel, QComboBox, QSlider, QLineEdit,
-                           QPushButton, QFrame, QGroupBox)
+                           QPushButton, QFrame, QGroupBox, QCheckBox)
 from PyQt5.QtCore import Qt, QTimer
 from PyQt5.QtGui import QFont, QPalette, QColor
 import matplotlib
@@ -9,9 +9,38 @@ matplotlib.use('Qt5Agg')
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.figure import Figure
 import numpy as np
-from simulation import VehicleSimulation
+import time as timer
+from simulation import VehicleSimulation, VEHICLE_LENGTH
+from models import model_names
+from plots import SpaceTimeRaster, TrajectoryLines, VehicleMarkers, default_highlight, trajectory_vehicles
+from worker import SimulationWorker
+from history import SlidingWindow
+from profiling import PhaseProfiler
+from spectral import WaveSpectrum, format_spectrum
 from matplotlib.patches import Circle
 
+# Length of the trajectory and time series windows (s)
+TIME_WINDOW = 200
+# The time series axis scrolls by this much once the data reaches its right edge (s)
+TIME_SCROLL = 50
+DT = 0.05
+# Time series samples kept for plotting: one 200 s window
+SERIES_CAPACITY = int(round(TIME_WINDOW / DT)) + 1
+
+# Simulated time skipped by "Start warmed up", from the warm-start cache after the first time (s)
+WARM_UP_TIME = 300
+
+# "Show spectrum" samples the ring every this many steps and averages over about this long (s)
+SPECTRUM_EVERY = 5
+SPECTRUM_MEMORY = 60.0
+
+# Trajectory panel modes: the vehicle field shown as a space-time image (None: lines)
+TRAJECTORY_VIEWS = {"Lines": None, "Speed raster": "speed", "Gap raster": "gap"}
+
+def time_series_start(current_time):
+    """Left edge of the time series axis, moved in TIME_SCROLL steps"""
+    return max(0.0, np.ceil((current_time - TIME_WINDOW) / TIME_SCROLL) * TIME_SCROLL)
+
 class SimulationGUI(QMainWindow):
     def __init__(self):
         super().__init__()
@@ -120,11 +149,8 @@ class SimulationGUI(QMainWindow):
         model_label = QLabel("Model:")
         model_layout.addWidget(model_label)
         self.model_combo = QComboBox()
-        self.model_combo.addItems([
-            "SOVM", "SOVM unstable", "SFVDM", "SFVDM unstable",
-            "Tomer et al.", "Tomer et al. unstable",
-            "SIDM", "SIDM unstable", "SATG"
-        ])
+        # Every registered model, including user-registered ones
+        self.model_combo.addItems(model_names())
         self.model_combo.setCurrentText("SATG")
         self.model_combo.currentTextChanged.connect(self.change_model)
         model_layout.addWidget(self.model_combo)
@@ -159,6 +185,34 @@ class SimulationGUI(QMainWindow):
         self.seed_input = QLineEdit("22")
         model_layout.addWidget(self.seed_input)
 
+        # Ring size, applied on reset
+        vehicles_label = QLabel("Vehicles:")
+        model_layout.addWidget(vehicles_label)
+        self.vehicles_input = QLineEdit("22")
+        model_layout.addWidget(self.vehicles_input)
+        length_label = QLabel("Circuit length [m]:")
+        model_layout.addWidget(length_label)
+        self.length_input = QLineEdit("231.0")
+        model_layout.addWidget(self.length_input)
+
+        # Highlighted (blue) vehicles, comma separated indices
+        highlight_label = QLabel("Highlighted vehicles:")
+        model_layout.addWidget(highlight_label)
+        self.highlight_input = QLineEdit("21")
+        model_layout.addWidget(self.highlight_input)
+
+        # Start resets from the state after WARM_UP_TIME, cached on disk (see warmcache.py)
+        self.warm_checkbox = QCheckBox(f"Start warmed up ({WARM_UP_TIME} s)")
+        model_layout.addWidget(self.warm_checkbox)
+
+        # Trajectory panel: vehicle lines or a space-time image of speed or gap
+        view_label = QLabel("Trajectory view:")
+        model_layout.addWidget(view_label)
+        self.view_combo = QComboBox()
+        self.view_combo.addItems(list(TRAJECTORY_VIEWS))
+        self.view_combo.currentTextChanged.connect(self.change_trajectory_view)
+        model_layout.addWidget(self.view_combo)
+
         control_layout.addWidget(model_group)
 
         # Control buttons
@@ -167,11 +221,32 @@ class SimulationGUI(QMainWindow):
         button_layout.setSpacing(8)
         
         # Tick counter
-        self.tick_counter = 0
         tick_label = QLabel("Ticks:")
         button_layout.addWidget(tick_label)
         self.tick_display = QLabel("0")
         button_layout.addWidget(self.tick_display)
+
+        # Achieved frame rate
+        fps_label = QLabel("Frame rate:")
+        button_layout.addWidget(fps_label)
+        self.fps_display = QLabel("-")
+        button_layout.addWidget(self.fps_display)
+
+        # Blitting redraws only the moving artists over a cached background
+        self.blit_checkbox = QCheckBox("Fast rendering (blit)")
+        self.blit_checkbox.setChecked(True)
+        self.blit_checkbox.toggled.connect(self.change_rendering)
+        button_layout.addWidget(self.blit_checkbox)
+
+        # Per-phase timings of the simulation step and the frame, shown over the plots
+        self.profile_checkbox = QCheckBox("Show profile")
+        self.profile_checkbox.toggled.connect(self.toggle_profiling)
+        button_layout.addWidget(self.profile_checkbox)
+
+        # Running spectrum of the gap and speed fields with wavelength and wave speed, over the plots
+        self.spectrum_checkbox = QCheckBox("Show spectrum")
+        self.spectrum_checkbox.toggled.connect(self.toggle_spectrum)
+        button_layout.addWidget(self.spectrum_checkbox)
         
         # Reset button
         self.reset_button = QPushButton("Reset")
@@ -203,25 +278,71 @@ class SimulationGUI(QMainWindow):
         plot_layout.addWidget(self.canvas)
         layout.addWidget(plot_widget)
 
-        # Setup plots
-        self.setup_plots()
-
         # Create simulation
         self.sim = VehicleSimulation(
             n_vehicles=22,
             circuit_length=231.0,
-            dt=0.05,
+            dt=DT,
             model="SATG",
             sigma=0.6,
-            seed=22
+            seed=22,
+            # The GUI plots its own time series buffer, only the latest step is kept
+            history_capacity=1
         )
+        self.highlight = default_highlight(self.sim.n)
+
+        # Setup plots
+        self.blit = True
+        self._background = None
+        self._full_redraw = True
+        self._last_frame = None
+        self._fps = None
+        self._vehicle_artists = []
+        self.setup_plots()
+        self.canvas.mpl_connect('draw_event', self.on_draw)
+
+        # Profiling, off until enabled
+        self.profiler = None
+        self.sim_profiler = None
+        self._profile_shown = 0.0
+        self.profile_overlay = QLabel(self.canvas)
+        self.profile_overlay.setFont(QFont("Monospace", 9))
+        self.profile_overlay.setStyleSheet("background-color: rgba(255, 255, 255, 220); padding: 6px;")
+        self.profile_overlay.move(10, 10)
+        self.profile_overlay.hide()
+
+        # Spectrum, off until enabled
+        self.spectrum = None
+        self.spectrum_overlay = QLabel(self.canvas)
+        self.spectrum_overlay.setFont(QFont("Monospace", 9))
+        self.spectrum_overlay.setStyleSheet("background-color: rgba(255, 255, 255, 220); padding: 6px;")
+        self.spectrum_overlay.hide()
 
-        # Setup animation timer
+        # The physics runs on a worker thread at the slider rate (ticks/sec)
+        self.simulation_running = True
+        self.start_worker()
+
+        # Setup animation timer; each frame shows the latest published state
         self.timer = QTimer()
         self.timer.timeout.connect(self.update_plots)
         self.timer.start(50)  # Update every 50ms (20 FPS)
-        self.simulation_running = True
-        self.speed_multiplier = 1.0  # Initialize speed multiplier
+
+    def start_worker(self):
+        self.sim.profiler = self.sim_profiler
+        if self.spectrum is not None:
+            self.spectrum.reset()
+            self.sim.observables = [self.spectrum]
+        self.worker = SimulationWorker(self.sim, self.speed_slider.value(), SERIES_CAPACITY)
+        self.worker.running = self.simulation_running
+        self._last_tick = self.sim.tick
+        # Plotted time series, appended in O(1) per step
+        self.series = SlidingWindow(SERIES_CAPACITY)
+        self._page = int(self.sim.time // TIME_WINDOW)
+        self.worker.start()
+
+    def closeEvent(self, event):
+        self.worker.stop()
+        super().closeEvent(event)
 
     def setup_plots(self):
         # Create a 2x1 grid with the left column split into two rows
@@ -229,28 +350,11 @@ class SimulationGUI(QMainWindow):
         
         # Live simulation (top left)
         self.ax_live = self.fig.add_subplot(gs[0, 0])
-        radius = 231.0/(2*np.pi)
-        self.circle = Circle((0, 0), radius, fill=False, color='#d2d2d7', linestyle='--')
-        self.ax_live.add_patch(self.circle)
         self.ax_live.set_aspect('equal')
-        self.ax_live.set_xlim(-radius*1.2, radius*1.2)
-        self.ax_live.set_ylim(-radius*1.2, radius*1.2)
         self.ax_live.grid(True, color='#f0f0f0')
         self.ax_live.set_title("Live Simulation", pad=20)
         self.ax_live.set_facecolor('white')
 
-        # Initialize vehicle plots
-        self.vehicle_plots = []
-        angles = np.zeros(22)
-        x_pos = radius * np.cos(angles)
-        y_pos = radius * np.sin(angles)
-        for i in range(22):
-            if i == 21:
-                plot, = self.ax_live.plot(x_pos[i], y_pos[i], 'bo', markersize=10)
-            else:
-                plot, = self.ax_live.plot(x_pos[i], y_pos[i], 'ko', markersize=8)
-            self.vehicle_plots.append(plot)
-
         # Time series (bottom left)
         self.ax_time = self.fig.add_subplot(gs[1, 0])
         self.mean_speed_line, = self.ax_time.plot([], [], 'b-', label='Mean speed [m/s]')
@@ -268,132 +372,242 @@ class SimulationGUI(QMainWindow):
         self.ax_traj.set_ylabel("Time [s]", labelpad=10)
         self.ax_traj.set_title("Trajectories", pad=20)
         self.ax_traj.grid(True, color='#f0f0f0')
-        self.ax_traj.set_xlim(-115, 115)
-        self.ax_traj.set_ylim(0, 200)
+        self.ax_traj.set_ylim(0, TIME_WINDOW)
         self.ax_traj.set_facecolor('white')
-        
-        # Initialize trajectory lines
-        self.traj_lines = []
-        self.traj_data = {i: {'x': [], 'y': []} for i in range(22)}
-        for i in range(22):
-            if i == 21:  # Special blue vehicle
-                line, = self.ax_traj.plot([], [], 'b-', linewidth=2.0, alpha=1.0)
-            else:
-                line, = self.ax_traj.plot([], [], 'k-', linewidth=1.0, alpha=0.6)
-            self.traj_lines.append(line)
+
+        # Vehicle markers and trajectory lines depend on the ring size
+        self.setup_vehicle_artists()
 
         # Adjust layout
         self.fig.tight_layout(pad=3.0)
 
+    def setup_vehicle_artists(self):
+        """(Re)create the ring, vehicle and trajectory artists for the current ring"""
+        for artist in self._vehicle_artists:
+            artist.remove()
+        n = self.sim.n
+        L = self.sim.L
+
+        radius = L/(2*np.pi)
+        self.circle = Circle((0, 0), radius, fill=False, color='#d2d2d7', linestyle='--')
+        self.ax_live.add_patch(self.circle)
+        self.ax_live.set_xlim(-radius*1.2, radius*1.2)
+        self.ax_live.set_ylim(-radius*1.2, radius*1.2)
+
+        # One marker artist for all vehicles, highlighted ones in blue on top
+        self.vehicle_markers = VehicleMarkers(self.ax_live, L, n, self.highlight)
+        self.vehicle_markers.update(self.sim.x)
+
+        self.ax_traj.set_xlim(-L/2, L/2)
+        self.ax_traj.set_ylim(0, TIME_WINDOW)
+        self.raster_field = TRAJECTORY_VIEWS[self.view_combo.currentText()]
+        # Grid lines would be covered when the raster is redrawn into the background
+        if self.raster_field is None:
+            self.ax_traj.grid(True, color='#f0f0f0')
+        else:
+            self.ax_traj.grid(False)
+        if self.raster_field is None:
+            # Trajectories of the highlighted vehicles and an evenly spread subset
+            self.ax_traj.set_title("Trajectories", pad=20)
+            self.trajectories = TrajectoryLines(
+                self.ax_traj, L, trajectory_vehicles(n, self.highlight), self.highlight,
+                line_kw={'color': 'k', 'linewidth': 1.0, 'alpha': 0.6},
+                highlight_kw={'color': 'b', 'linewidth': 2.0, 'alpha': 1.0}
+            )
+        else:
+            # Speed or gap of all vehicles on a fixed space x time grid; jams show in red,
+            # the uniform flow of the initial state in the middle of the color scale
+            if self.raster_field == "speed":
+                vmax = max(1.0, 2 * np.mean(self.sim.speed))
+                self.ax_traj.set_title(f"Speed [m/s], 0 (red) to {vmax:.0f} (green)", pad=20)
+            else:
+                vmax = max(1.0, 2 * (L / n - VEHICLE_LENGTH))
+                self.ax_traj.set_title(f"Gap [m], 0 (red) to {vmax:.0f} (green)", pad=20)
+            self.trajectories = SpaceTimeRaster(self.ax_traj, L, TIME_WINDOW, vmin=0.0, vmax=vmax)
+        self._vehicle_artists = [self.circle] + self.vehicle_markers.artists + self.trajectories.artists
+
+        # Artists that change every frame; with blitting they are left out of full draws.
+        # The raster only changes when a row is added, so it stays in the cached
+        # background, which is updated in place when it changes
+        self._raster_rows = None
+        self._animated = self.vehicle_markers.artists + [self.mean_speed_line, self.gap_sd_line]
+        if self.raster_field is None:
+            self._animated += self.trajectories.artists
+        for artist in self._animated:
+            artist.set_animated(self.blit)
+        self._full_redraw = True
+
+    def on_draw(self, event):
+        """After a full draw: cache the static background and add the moving artists"""
+        if self.blit:
+            self._background = self.canvas.copy_from_bbox(self.fig.bbox)
+            for artist in self._animated:
+                artist.axes.draw_artist(artist)
+
+    def draw_frame(self, steps_per_second=0.0):
+        if self.blit and self._background is not None and not self._full_redraw:
+            # Only the moving artists over the cached background
+            self.canvas.restore_region(self._background)
+            if self.raster_field is not None and self.trajectories.next_row != self._raster_rows:
+                # New raster rows: draw the image into the background
+                self._raster_rows = self.trajectories.next_row
+                self.ax_traj.draw_artist(self.trajectories.image)
+                self._background = self.canvas.copy_from_bbox(self.fig.bbox)
+            for artist in self._animated:
+                artist.axes.draw_artist(artist)
+            self.canvas.blit(self.fig.bbox)
+            if self.profiler is not None:
+                self.profiler.mark("blit")
+        else:
+            self._full_redraw = False
+            self.canvas.draw()
+            if self.profiler is not None:
+                self.profiler.mark("full draw")
+
+        # Exponential average of the achieved frame rate
+        now = timer.perf_counter()
+        if self._last_frame is not None and now > self._last_frame:
+            fps = 1.0 / (now - self._last_frame)
+            self._fps = fps if self._fps is None else 0.9 * self._fps + 0.1 * fps
+            self.fps_display.setText(f"{self._fps:.1f} FPS, {steps_per_second:.0f} ticks/s")
+        self._last_frame = now
+
+        if self.profiler is not None and now - self._profile_shown >= 1.0:
+            self._profile_shown = now
+            self.profile_overlay.setText(f"Simulation step\n{self.sim_profiler.table()}\n\n"
+                                         f"GUI frame\n{self.profiler.table()}")
+            self.profile_overlay.adjustSize()
+        if self.spectrum is not None and now - self._spectrum_shown >= 1.0:
+            self._spectrum_shown = now
+            self.show_spectrum()
+
+    def show_spectrum(self):
+        self.spectrum_overlay.setText(format_spectrum(self.spectrum))
+        self.spectrum_overlay.adjustSize()
+        # Top right corner, clear of the profile table
+        self.spectrum_overlay.move(self.canvas.width() - self.spectrum_overlay.width() - 10, 10)
+
+    def toggle_spectrum(self, enabled):
+        if enabled:
+            self.spectrum = WaveSpectrum(every=SPECTRUM_EVERY, memory=SPECTRUM_MEMORY)
+            self._spectrum_shown = 0.0
+            self.show_spectrum()
+            self.spectrum_overlay.show()
+            observables = [self.spectrum]
+        else:
+            self.spectrum = None
+            self.spectrum_overlay.hide()
+            observables = []
+        self.worker.submit(setattr, self.sim, "observables", observables)
+
+    def toggle_profiling(self, enabled):
+        if enabled:
+            self.profiler = PhaseProfiler()
+            self.sim_profiler = PhaseProfiler()
+            self.profile_overlay.setText("Profiling...")
+            self.profile_overlay.adjustSize()
+            self.profile_overlay.show()
+        else:
+            self.profiler = None
+            self.sim_profiler = None
+            self.profile_overlay.hide()
+        self.worker.submit(setattr, self.sim, "profiler", self.sim_profiler)
+
+    def change_rendering(self, blit):
+        self.blit = blit
+        for artist in self._animated:
+            artist.set_animated(blit)
+        self._background = None
+        self._full_redraw = True
+
     def update_plots(self):
-        if self.simulation_running:
-            # Run multiple simulation steps based on speed setting
-            steps = int(self.speed_multiplier)
-            for _ in range(steps):
-                self.sim.step()
-                self.tick_counter += 1
+        prof = self.profiler
+        if prof is not None:
+            prof.start()
+        with self.worker.lock:
+            snap = self.worker.take()
+            if snap.tick == self._last_tick and not self._full_redraw:
+                return  # nothing new to show
+            if prof is not None:
+                prof.mark("snapshot")
+            self._last_tick = snap.tick
             # Update tick display
-            self.tick_display.setText(str(self.tick_counter))
+            self.tick_display.setText(str(snap.tick))
             
             # Update live view
-            radius = 231.0/(2*np.pi)
-            angles = 2 * np.pi * self.sim.x / 231.0
-            for i, (angle, plot) in enumerate(zip(angles, self.vehicle_plots)):
-                x_pos = radius * np.cos(angle)
-                y_pos = radius * np.sin(angle)
-                plot.set_data([x_pos], [y_pos])
+            self.vehicle_markers.update(snap.x)
+            
+            # Append the new time series samples
+            new_samples = snap.series.values()
+            self.series.extend(snap.series)
+            current_time = snap.time
+            
+            # Start new trajectories when they reach the top of the diagram
+            page = int(current_time // TIME_WINDOW)
+            if page != self._page:
+                self._page = page
+                self.trajectories.clear()
+                self._full_redraw = True
             
             # Update trajectories and time series
-            if len(self.sim.history["x"]) > 2:
-                x = np.array(self.sim.history["x"])
-                time = np.array(self.sim.history["time"])
-                current_time = time[-1]
+            if len(self.series) > 2:
+                # Add the current positions (or field values) to the trajectories
+                if self.raster_field is None:
+                    self.trajectories.append(snap.x, current_time - page * TIME_WINDOW)
+                else:
+                    self.trajectories.append(snap.x, getattr(snap, self.raster_field),
+                                             current_time - page * TIME_WINDOW)
                 
-                # Check if we need to reset trajectories (reached top of diagram)
-                if current_time >= 200:
-                    # Reset simulation time but keep history for time series
-                    self.sim.time = 0
-                    # Clear only trajectory data
-                    for i in range(22):
-                        self.traj_data[i]['x'] = []
-                        self.traj_data[i]['y'] = []
-                    # Keep time series data but reset trajectory history
-                    self.sim.history["x"] = [self.sim.x.copy()]
-                    self.sim.history["time"] = [0]
-                    self.sim.history["mean_speed"] = [np.mean(self.sim.speed)]
-                    self.sim.history["gap_sd"] = [np.std(self.sim.gap)]
-                    return
+                # Hand the line artists views of the sliding window
+                self.mean_speed_line.set_data(self.series["time"], self.series["mean_speed"])
+                self.gap_sd_line.set_data(self.series["time"], self.series["gap_sd"])
                 
-                # Process each vehicle's trajectory
-                circuit_length = 231.0
-                
-                for i in range(22):
-                    # Get the latest point
-                    x_pos = x[-1, i]
-                    
-                    # Center and unwrap x position
-                    x_centered = x_pos - circuit_length/2
-                    rounds = np.floor(x_pos / circuit_length)
-                    x_unwrapped = x_centered - (rounds * circuit_length)
-                    
-                    # Add new point if it doesn't create a wrap-around line
-                    if (len(self.traj_data[i]['x']) == 0 or 
-                        abs(x_unwrapped - self.traj_data[i]['x'][-1]) < circuit_length/2):
-                        self.traj_data[i]['x'].append(x_unwrapped)
-                        self.traj_data[i]['y'].append(current_time)
-                    else:
-                        # Start a new segment
-                        self.traj_data[i]['x'].append(None)  # Break the line
-                        self.traj_data[i]['y'].append(None)
-                        self.traj_data[i]['x'].append(x_unwrapped)
-                        self.traj_data[i]['y'].append(current_time)
-                    
-                    # Update the line
-                    self.traj_lines[i].set_data(self.traj_data[i]['x'], self.traj_data[i]['y'])
-                
-                # Update time series - show only the most recent 200 seconds
-                window_start = max(0, current_time - 200)
-                window_end = current_time
-                
-                # Convert history lists to numpy arrays for comparison
-                time_array = np.array(self.sim.history["time"])
-                mean_speed_array = np.array(self.sim.history["mean_speed"])
-                gap_sd_array = np.array(self.sim.history["gap_sd"])
-                
-                # Filter data to show only the current window
-                mask = (time_array >= window_start) & (time_array <= window_end)
-                window_time = time_array[mask]
-                window_mean_speed = mean_speed_array[mask]
-                window_gap_sd = gap_sd_array[mask]
-                
-                # Update the lines with windowed data
-                self.mean_speed_line.set_data(window_time, window_mean_speed)
-                self.gap_sd_line.set_data(window_time, window_gap_sd)
-                
-                # Set the x-axis limits to show the current window
-                self.ax_time.set_xlim(window_start, window_end)
-                self.ax_time.relim()
-                self.ax_time.autoscale_view()
-            
-            self.canvas.draw()
+                # Change the axis limits (and redraw the axes) only when needed:
+                # a 200 s time window scrolled in steps, y range grown when new data leaves it
+                window_start = time_series_start(current_time)
+                self.set_limits(self.ax_time, x=(window_start, window_start + TIME_WINDOW))
+                if new_samples.shape[1]:
+                    low = new_samples[1:].min()
+                    high = new_samples[1:].max()
+                    y_low, y_high = self.ax_time.get_ylim()
+                    if low < y_low or high > y_high:
+                        margin = 0.1 * max(high - low, 1.0)
+                        self.set_limits(self.ax_time, y=(min(low, y_low) - margin, max(high, y_high) + margin))
+            steps_per_second = snap.steps_per_second
+            if prof is not None:
+                prof.mark("artists")
+        
+        self.draw_frame(steps_per_second)
+
+    def set_limits(self, ax, x=None, y=None):
+        """Set axis limits, asking for a full redraw only if they actually change"""
+        if x is not None and tuple(ax.get_xlim()) != tuple(x):
+            ax.set_xlim(*x)
+            self._full_redraw = True
+        if y is not None and tuple(ax.get_ylim()) != tuple(y):
+            ax.set_ylim(*y)
+            self._full_redraw = True
+
+    def change_trajectory_view(self, view):
+        self.setup_vehicle_artists()
 
     def change_model(self, model):
-        self.sim.model = model
+        self.worker.submit(setattr, self.sim, "model", model)
 
     def change_sigma(self):
         value = self.sigma_slider.value() / 100.0
         self.sigma_label.setText(f"{value:.2f}")
-        self.sim.sigma = value
+        self.worker.submit(setattr, self.sim, "sigma", value)
 
     def change_speed(self):
         speed = self.speed_slider.value()
         self.speed_label.setText(str(speed))
-        self.timer.setInterval(50)  # Keep constant 20 FPS refresh rate
-        # Store the speed multiplier for use in update_plots
-        self.speed_multiplier = speed / 20
+        # The frame rate stays at 20 FPS, the worker runs `speed` ticks per second
+        self.worker.set_rate(speed)
 
     def toggle_simulation(self):
         self.simulation_running = not self.simulation_running
+        self.worker.set_running(self.simulation_running)
         if self.simulation_running:
             self.start_stop_button.setText("Stop")
         else:
@@ -404,40 +618,63 @@ class SimulationGUI(QMainWindow):
             seed = int(self.seed_input.text())
         except ValueError:
             seed = 22
+        try:
+            n_vehicles = max(1, int(self.vehicles_input.text()))
+        except ValueError:
+            n_vehicles = 22
+        try:
+            circuit_length = float(self.length_input.text())
+        except ValueError:
+            circuit_length = 0.0
+        if circuit_length < VEHICLE_LENGTH * n_vehicles:
+            # Too short for the vehicles: use the Sugiyama density instead
+            circuit_length = 10.5 * n_vehicles
+        try:
+            highlight = [int(i) for i in self.highlight_input.text().split(",") if i.strip()]
+            self.highlight = [i for i in highlight if 0 <= i < n_vehicles] or default_highlight(n_vehicles)
+        except ValueError:
+            self.highlight = default_highlight(n_vehicles)
 
+        self.worker.stop()
         self.sim = VehicleSimulation(
-            n_vehicles=22,
-            circuit_length=231.0,
-            dt=0.05,
+            n_vehicles=n_vehicles,
+            circuit_length=circuit_length,
+            dt=DT,
             model=self.model_combo.currentText(),
             sigma=self.sigma_slider.value() / 100.0,
-            seed=seed
+            seed=seed,
+            # The GUI plots its own time series buffer, only the latest step is kept
+            history_capacity=1
         )
+        if self.warm_checkbox.isChecked():
+            self.sim.warm_up(int(round(WARM_UP_TIME / DT)))
         
         # Reset tick counter
-        self.tick_counter = 0
-        self.tick_display.setText("0")
+        self.tick_display.setText(str(self.sim.tick))
         
-        # Clear trajectory data
-        for i in range(22):
-            self.traj_data[i] = {'x': [], 'y': []}
-            self.traj_lines[i].set_data([], [])
+        # Rebuild vehicle artists for the new ring
+        self.setup_vehicle_artists()
         
         # Clear time series data
         self.mean_speed_line.set_data([], [])
         self.gap_sd_line.set_data([], [])
         
         # Reset axes limits
-        self.ax_traj.set_ylim(0, 200)
-        self.ax_time.set_xlim(0, 200)
+        self.ax_traj.set_ylim(0, TIME_WINDOW)
+        self.ax_time.set_xlim(0, TIME_WINDOW)
+        self.ax_time.set_ylim(0, 1)
         
         # Redraw canvas
+        self._full_redraw = False
         self.canvas.draw()
+        
+        self.start_worker()
 
     def apply_perturbation(self):
-        """Apply a braking perturbation to the blue vehicle"""
+        """Apply a braking perturbation to the blue vehicles"""
         if self.sim:
-            self.sim.apply_perturbation()
+            for vehicle in self.highlight:
+                self.worker.submit(self.sim.apply_perturbation, vehicle)
 
 def main():
     app = QApplication(sys.argv)
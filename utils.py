@@ -7,14 +7,34 @@ def Z(y):
     return (y + np.abs(y)) / 2
 
 def logsumexp(a, b, eps):
-    # Avoid overflow
+    # Works elementwise on scalars and arrays alike
+    a = np.asarray(a, dtype=float)
+    b = np.asarray(b, dtype=float)
     a_eps = a / eps
     b_eps = b / eps
-    if np.abs(b_eps) < 700 and np.abs(a_eps) < 700:
-        return eps * np.log(np.exp(a_eps) + np.exp(b_eps))
+    # Avoid overflow: only exponentiate where both terms are in range
+    inside = (np.abs(b_eps) < 700) & (np.abs(a_eps) < 700)
+    smooth = eps * np.log(np.exp(np.where(inside, a_eps, 0.0)) + np.exp(np.where(inside, b_eps, 0.0)))
+    # Match NetLogo's behavior: if eps > 0 return max, else return min
+    if eps > 0:
+        hard = np.maximum(a, b)
     else:
-        # Match NetLogo's behavior: if eps > 0 return max, else return min
-        if eps > 0:
-            return max(a, b)
-        else:
-            return min(a, b)
+        hard = np.minimum(a, b)
+    return np.where(inside, smooth, hard)[()]
+
+def volatility(v, sigma, out=None):
+    # Noise volatility s(v): sigmoid switching the noise off below 0.1 m/s
+    if out is None:
+        return sigma / (1 + np.exp(np.minimum(700, -1000 * (v - 0.1))))
+    # Same operations, written into a preallocated buffer
+    np.subtract(v, 0.1, out=out)
+    np.multiply(out, -1000, out=out)
+    np.minimum(out, 700, out=out)
+    np.exp(out, out=out)
+    np.add(out, 1, out=out)
+    return np.divide(sigma, out, out=out)
+
+def volatility_derivative(v, sigma):
+    # ds/dv of the volatility sigmoid, used by the Milstein correction
+    e = np.exp(np.minimum(700, -1000 * (v - 0.1)))
+    return sigma * 1000 * e / (1 + e) ** 2
@@ -0,0 +1,141 @@
+"""On-disk cache of warmed-up simulation states.
+
+A warm-up is the first ``steps`` steps of a run from the usual uniform
+start. Its end state depends only on the configuration (model and its
+parameters, per-vehicle models, sigma, n, L, dt, seed, spacing mode) and on
+``steps``, so it is stored as a checkpoint file (see checkpoint.py) under
+a hash of those values and reused by every later run with the same key:
+
+    sim = VehicleSimulation(model="SOVM", seed=3)
+    sim.warm_up(6000)                    # simulated once, then loaded
+
+Files live in ``$NOISE_SIM_CACHE`` (default ``~/.cache/noise_induced_sim``).
+The cache is bounded by ``max_bytes``: after every store the least recently
+used files are deleted until it fits again. Unseeded runs (seed=None) are
+never cached: each of them must start from its own random warm-up.
+"""
+import hashlib
+import json
+import os
+import tempfile
+
+from checkpoint import VERSION, read_checkpoint, save_checkpoint
+from models import get_model
+
+DEFAULT_DIR = os.environ.get("NOISE_SIM_CACHE", os.path.join("~", ".cache", "noise_induced_sim"))
+MAX_BYTES = 256 * 1024 ** 2
+SUFFIX = ".npz"
+
+
+def _model_key(model):
+    # Registered names can be re-registered with other parameters: key on the function and values
+    model = get_model(model)
+    return [model.name, getattr(model.accel, "__qualname__", repr(model.accel)), model.params]
+
+
+def warm_key(sim, steps):
+    """Cache key of the first `steps` steps of `sim` from its initial state"""
+    config = sim.config()
+    config.pop("history_capacity")
+    config["model"] = _model_key(sim._model)
+    if sim.vehicle_models is not None:
+        config["vehicle_models"] = [None if m is None else _model_key(m) for m in sim.vehicle_models]
+    config.update(steps=steps, version=VERSION)
+    text = json.dumps(config, sort_keys=True, default=repr)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+class WarmStartCache:
+    """Directory of warm-up checkpoints with size-bounded LRU eviction"""
+
+    def __init__(self, directory=DEFAULT_DIR, max_bytes=MAX_BYTES):
+        self.directory = os.path.expanduser(directory)
+        self.max_bytes = max_bytes
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + SUFFIX)
+
+    def load(self, key):
+        """State stored under key (see VehicleSimulation.get_state), or None; marks it as recently used"""
+        path = self._path(key)
+        try:
+            state = read_checkpoint(path)
+        except (OSError, ValueError, KeyError):
+            return None
+        os.utime(path)
+        return state
+
+    def store(self, key, sim):
+        os.makedirs(self.directory, exist_ok=True)
+        # Write under a temporary name first so readers never see a partial file
+        fd, tmp = tempfile.mkstemp(suffix=SUFFIX, dir=self.directory)
+        os.close(fd)
+        try:
+            save_checkpoint(sim, tmp)
+            os.replace(tmp, self._path(key))
+        except BaseException:
+            os.remove(tmp)
+            raise
+        self.evict()
+
+    def entries(self):
+        """(last use, size, path) of every cached file, oldest first"""
+        if not os.path.isdir(self.directory):
+            return []
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(SUFFIX):
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return sorted(entries)
+
+    def size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        """Delete the least recently used files until the cache fits in max_bytes"""
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def clear(self):
+        for _, _, path in self.entries():
+            os.remove(path)
+
+    def warm_up(self, sim, steps):
+        """Bring a fresh sim to its state after `steps` steps, from the cache when possible.
+
+        Returns True on a cache hit. On a miss the warm-up runs with the
+        observables, profiler and stream of sim detached, so that they only
+        see the warmed-up state, as on a hit. Either way the history
+        restarts at the warmed-up state. A sim without a seed always runs
+        its warm-up and stores nothing.
+        """
+        if sim.tick != 0:
+            raise ValueError("warm_up() needs a simulation that has not been stepped yet")
+        key = None if sim.seed is None else warm_key(sim, steps)
+        state = None if key is None else self.load(key)
+        if state is not None:
+            sim.set_state(state)
+            return True
+        attached = sim.observables, sim.profiler, sim.writer
+        sim.observables, sim.profiler, sim.writer = [], None, None
+        try:
+            sim.run(steps, record_every=0)
+        finally:
+            sim.observables, sim.profiler, sim.writer = attached
+        if key is not None:
+            self.store(key, sim)
+        sim.set_state(sim.get_state())
+        return False
@@ -0,0 +1,176 @@
+"""Background simulation thread for the GUI.
+
+The worker advances a VehicleSimulation on its own QThread at a requested
+rate in ticks per second, independent of the GUI frame rate. After every
+batch of steps it fills a back Snapshot and, once the GUI has taken the
+front one, swaps the two under a lock; the GUI reads the front snapshot
+under the same lock at its own pace. Each snapshot carries the time series
+samples of the steps since the previous one, so none are lost when the
+GUI skips a snapshot. Changes to the simulation (sigma, model, perturbations) are
+queued with ``submit`` and applied between steps by the worker.
+"""
+import queue
+import threading
+import time as timer
+
+import numpy as np
+from PyQt5.QtCore import QThread
+from history import SlidingWindow
+
+# Longest time the worker simulates before publishing a snapshot (s)
+PUBLISH_INTERVAL = 0.02
+# A backlog beyond this much wall time is dropped instead of caught up (s)
+MAX_BACKLOG = 0.25
+
+
+class StepRateController:
+    """Number of steps owed at a (possibly fractional) rate in ticks per second.
+
+    The fractional part of the owed steps is carried over, so over time the
+    number of steps taken matches rate * elapsed exactly.
+    """
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.reset()
+
+    def reset(self, now=None):
+        self._last = timer.perf_counter() if now is None else now
+        self._owed = 0.0
+
+    def set_rate(self, rate, now=None):
+        # Settle what is owed at the old rate first
+        self.due(now)
+        self.rate = rate
+
+    def due(self, now=None, limit=None):
+        """Steps to take now (at most `limit`); they are counted as taken"""
+        now = timer.perf_counter() if now is None else now
+        self._owed = min(self._owed + (now - self._last) * self.rate,
+                         max(1.0, MAX_BACKLOG * self.rate))
+        self._last = now
+        steps = int(self._owed) if limit is None else min(int(self._owed), limit)
+        self._owed -= steps
+        return steps
+
+    def wait_time(self):
+        """Seconds until the next step is due"""
+        return max(0.0, (1.0 - self._owed) / self.rate) if self.rate > 0 else PUBLISH_INTERVAL
+
+
+class Snapshot:
+    """State published by the worker: vehicle fields, clock and the new time series samples"""
+
+    def __init__(self, n_vehicles, series_capacity):
+        self.x = np.empty(n_vehicles)
+        self.speed = np.empty(n_vehicles)
+        self.gap = np.empty(n_vehicles)
+        self.time = 0.0
+        self.tick = 0
+        self.steps_per_second = 0.0
+        # (time, mean_speed, gap_sd) of every step since the previous snapshot
+        self.series = SlidingWindow(series_capacity)
+        # Set by the reader; the worker only replaces snapshots that were taken
+        self.taken = True
+
+
+class SimulationWorker(QThread):
+    """Runs `sim` at `rate` ticks per second until stopped.
+
+    Snapshots keep up to `series_capacity` time series samples between two
+    reads; older ones are dropped.
+    """
+
+    def __init__(self, sim, rate, series_capacity, parent=None):
+        super().__init__(parent)
+        self.sim = sim
+        self.controller = StepRateController(rate)
+        self.lock = threading.Lock()
+        self.running = True
+        self._stop = False
+        self._commands = queue.SimpleQueue()
+        self._front = Snapshot(sim.n, series_capacity)
+        self._back = Snapshot(sim.n, series_capacity)
+        self._rate_steps = 0
+        self._rate_start = timer.perf_counter()
+        self._steps_per_second = 0.0
+        self._sample()
+        self._publish()
+
+    def submit(self, function, *args):
+        """Call function(*args) on the worker thread between two steps"""
+        self._commands.put((function, args))
+
+    def set_rate(self, rate):
+        self.submit(self.controller.set_rate, rate)
+
+    def set_running(self, running):
+        self.submit(self._set_running, running)
+
+    def _set_running(self, running):
+        self.running = running
+        self.controller.reset()
+
+    def stop(self):
+        """Ask the thread to finish and wait for it"""
+        self._stop = True
+        self.wait()
+
+    def take(self):
+        """The latest snapshot; read it while holding `lock`.
+
+        Its time series samples are only handed out once: snapshots that
+        were taken before come back with an empty series.
+        """
+        snap = self._front
+        if snap.taken:
+            snap.series.clear()
+        snap.taken = True
+        return snap
+
+    def run(self):
+        self.controller.reset()
+        while not self._stop:
+            while not self._commands.empty():
+                function, args = self._commands.get()
+                function(*args)
+            if not self.running:
+                timer.sleep(PUBLISH_INTERVAL)
+                continue
+            steps = self.controller.due(limit=max(1, int(self.controller.rate * PUBLISH_INTERVAL)))
+            if steps == 0:
+                timer.sleep(min(self.controller.wait_time(), PUBLISH_INTERVAL))
+                continue
+            self._advance(steps)
+            self._publish()
+
+    def _advance(self, steps):
+        for _ in range(steps):
+            self.sim.step()
+            self._sample()
+        # Achieved step rate, measured over about one second
+        self._rate_steps += steps
+        now = timer.perf_counter()
+        if now - self._rate_start >= 1.0:
+            self._steps_per_second = self._rate_steps / (now - self._rate_start)
+            self._rate_steps = 0
+            self._rate_start = now
+
+    def _sample(self):
+        history = self.sim.history
+        self._back.series.append(self.sim.time, history.last("mean_speed", 1)[0],
+                                 history.last("gap_sd", 1)[0])
+
+    def _publish(self):
+        sim, snap = self.sim, self._back
+        snap.x[:] = sim.x
+        snap.speed[:] = sim.speed
+        snap.gap[:] = sim.gap
+        snap.time = sim.time
+        snap.tick = sim.tick
+        snap.steps_per_second = self._steps_per_second
+        with self.lock:
+            if self._front.taken:
+                snap.taken = False
+                self._front, self._back = snap, self._front
+                self._back.series.clear()